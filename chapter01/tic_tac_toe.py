@@ -10,10 +10,16 @@
 
 import numpy as np
 import pickle
+import os
 
 BOARD_ROWS = 3
 BOARD_COLS = 3
 BOARD_SIZE = BOARD_ROWS * BOARD_COLS
+# weight of each position in the base-3 hash, position (i, j) is cell i * BOARD_COLS + j
+HASH_WEIGHTS = 3 ** np.arange(BOARD_SIZE - 1, -1, -1)
+FULL_MASK = (1 << BOARD_SIZE) - 1
+# bitboard bit of each position, in the same cell order
+CELL_BITS = 1 << np.arange(BOARD_SIZE)
 
 
 class State:
@@ -26,15 +32,30 @@ class State:
         self.winner = None
         self.hash_val = None
         self.end = None
+        # bitboards of the positions taken by each player, bit i * BOARD_COLS + j is position (i, j)
+        # like the hash they are derived from the data on first use, next_state fills them incrementally
+        self.x_mask = None
+        self.o_mask = None
 
     # compute the hash value for one state, it's unique
     def hash(self):
         if self.hash_val is None:
-            self.hash_val = 0
-            for i in np.nditer(self.data):
-                self.hash_val = self.hash_val * 3 + i + 1
+            self.hash_val = int(np.dot(self.data.ravel() + 1, HASH_WEIGHTS))
         return self.hash_val
 
+    # bitboards of the positions taken by the first and the second player
+    def masks(self):
+        if self.x_mask is None:
+            cells = self.data.ravel()
+            self.x_mask = int(np.sum(CELL_BITS[cells == 1]))
+            self.o_mask = int(np.sum(CELL_BITS[cells == -1]))
+        return self.x_mask, self.o_mask
+
+    # bitboard of the empty positions
+    def empty_mask(self):
+        x_mask, o_mask = self.masks()
+        return FULL_MASK & ~(x_mask | o_mask)
+
     # check whether a player has won the game, or it's a tie
     def is_end(self):
         if self.end is not None:
@@ -83,6 +104,14 @@ class State:
         new_state = State()
         new_state.data = np.copy(self.data)
         new_state.data[i, j] = symbol
+        # update the hash and bitboards incrementally rather than rescanning the board
+        cell = i * BOARD_COLS + j
+        new_state.hash_val = self.hash() + int(symbol - self.data[i, j]) * int(HASH_WEIGHTS[cell])
+        new_state.x_mask, new_state.o_mask = self.masks()
+        if symbol == 1:
+            new_state.x_mask |= 1 << cell
+        else:
+            new_state.o_mask |= 1 << cell
         return new_state
 
     # print the board
@@ -124,8 +153,34 @@ def get_all_states():
     return all_states
 
 
+# all possible board configurations are cached on disk, bump the version when State changes
+ALL_STATES_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'all_states.pkl')
+ALL_STATES_VERSION = 1
+
+
+def load_all_states():
+    try:
+        with open(ALL_STATES_CACHE, 'rb') as f:
+            version, states = pickle.load(f)
+        if version == ALL_STATES_VERSION:
+            return states
+    except (OSError, EOFError, ValueError, AttributeError, ImportError, pickle.UnpicklingError):
+        # missing, stale or unreadable cache
+        pass
+    states = get_all_states()
+    if __name__ == '__main__':
+        # states pickled from a script run would reference __main__.State
+        return states
+    try:
+        with open(ALL_STATES_CACHE, 'wb') as f:
+            pickle.dump((ALL_STATES_VERSION, states), f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        pass
+    return states
+
+
 # all possible board configurations
-all_states = get_all_states()
+all_states = load_all_states()
 
 
 class Judger:
@@ -3,22 +3,26 @@
 Visualizes the game board in 3D with interactive gameplay
 """
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection
-import matplotlib.patches as mpatches
 import pickle
 import os
 import sys
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from plot_utils import env_flag, show_or_close
+
+import matplotlib.pyplot as plt
+from mpl_toolkits.mplot3d import Axes3D
+from mpl_toolkits.mplot3d.art3d import Poly3DCollection, Line3DCollection
+import matplotlib.patches as mpatches
+
 from chapter01.tic_tac_toe import State, Player, Judger, HumanPlayer, all_states
 
 # Setup image directory path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGE_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'images')
 
+
 class TicTacToe3D:
     def __init__(self):
         self.fig = plt.figure(figsize=(12, 10))
@@ -27,52 +31,42 @@ class TicTacToe3D:
         self.player1 = None
         self.player2 = None
         self.judger = None
+        self.grid_segments = self.build_grid_segments(3)
+        # O pieces are circles of radius 0.3, offsets relative to the cell centre
+        theta = np.linspace(0, 2*np.pi, 50)
+        self.circle_dx = 0.3 * np.cos(theta)
+        self.circle_dy = 0.3 * np.sin(theta)
+        self.setup_board()
         
-    def draw_board_3d(self, state):
-        """Draw the 3D tic-tac-toe board"""
-        self.ax.clear()
-        
-        # Board dimensions
-        board_size = 3
-        spacing = 1.2
-        
-        # Draw grid lines
+    @staticmethod
+    def build_grid_segments(board_size):
+        """Build the line segments of the board grid"""
+        segments = []
         for i in range(board_size + 1):
             # Vertical lines
-            self.ax.plot([i, i], [0, board_size], [0, 0], 'k-', linewidth=2)
-            self.ax.plot([i, i], [0, board_size], [0.1, 0.1], 'k-', linewidth=2)
+            segments.append([(i, 0, 0), (i, board_size, 0)])
+            segments.append([(i, 0, 0.1), (i, board_size, 0.1)])
             # Horizontal lines
-            self.ax.plot([0, board_size], [i, i], [0, 0], 'k-', linewidth=2)
-            self.ax.plot([0, board_size], [i, i], [0.1, 0.1], 'k-', linewidth=2)
+            segments.append([(0, i, 0), (board_size, i, 0)])
+            segments.append([(0, i, 0.1), (board_size, i, 0.1)])
             # Vertical connectors
-            self.ax.plot([i, i], [0, 0], [0, 0.1], 'k-', linewidth=2)
-            self.ax.plot([i, i], [board_size, board_size], [0, 0.1], 'k-', linewidth=2)
-        
-        # Draw pieces
-        for i in range(board_size):
-            for j in range(board_size):
-                x, y = j + 0.5, i + 0.5
-                z = 0.05
-                
-                if state.data[i, j] == 1:  # Player 1 (X)
-                    # Draw X as two crossing lines in 3D
-                    size = 0.3
-                    self.ax.plot([x-size, x+size], [y-size, y+size], [z, z], 'r-', linewidth=4)
-                    self.ax.plot([x-size, x+size], [y+size, y-size], [z, z], 'r-', linewidth=4)
-                    # Add depth
-                    self.ax.plot([x-size, x-size], [y-size, y-size], [z, z+0.05], 'r-', linewidth=2, alpha=0.5)
-                    self.ax.plot([x+size, x+size], [y+size, y+size], [z, z+0.05], 'r-', linewidth=2, alpha=0.5)
-                    
-                elif state.data[i, j] == -1:  # Player 2 (O)
-                    # Draw O as a circle in 3D
-                    theta = np.linspace(0, 2*np.pi, 50)
-                    radius = 0.3
-                    circle_x = x + radius * np.cos(theta)
-                    circle_y = y + radius * np.sin(theta)
-                    circle_z = np.full_like(theta, z)
-                    self.ax.plot(circle_x, circle_y, circle_z, 'b-', linewidth=4)
-                    # Add depth ring
-                    self.ax.plot(circle_x, circle_y, circle_z + 0.05, 'b-', linewidth=2, alpha=0.5)
+            segments.append([(i, 0, 0), (i, 0, 0.1)])
+            segments.append([(i, board_size, 0), (i, board_size, 0.1)])
+        return segments
+        
+    def setup_board(self):
+        """Create the static board and one persistent artist per piece style"""
+        board_size = 3
+        
+        # Draw grid lines
+        self.ax.add_collection3d(Line3DCollection(self.grid_segments, colors='k', linewidths=2))
+        
+        self.x_pieces = Line3DCollection([], colors='r', linewidths=4)
+        self.x_depth = Line3DCollection([], colors='r', linewidths=2, alpha=0.5)
+        self.o_pieces = Line3DCollection([], colors='b', linewidths=4)
+        self.o_depth = Line3DCollection([], colors='b', linewidths=2, alpha=0.5)
+        for collection in (self.x_pieces, self.x_depth, self.o_pieces, self.o_depth):
+            self.ax.add_collection(collection)
         
         # Set labels and title
         self.ax.set_xlabel('Column', fontsize=12)
@@ -90,11 +84,43 @@ class TicTacToe3D:
         
         plt.tight_layout()
         
+    def draw_board_3d(self, state):
+        """Draw the pieces of a state on the 3D tic-tac-toe board"""
+        # Collect piece segments so each style is drawn as a single artist
+        x_segments, x_depth_segments = [], []
+        o_segments, o_depth_segments = [], []
+        z = 0.05
+        
+        for i, j in np.argwhere(state.data == 1):  # Player 1 (X)
+            x, y = j + 0.5, i + 0.5
+            # Draw X as two crossing lines in 3D
+            size = 0.3
+            x_segments.append([(x-size, y-size, z), (x+size, y+size, z)])
+            x_segments.append([(x-size, y+size, z), (x+size, y-size, z)])
+            # Add depth
+            x_depth_segments.append([(x-size, y-size, z), (x-size, y-size, z+0.05)])
+            x_depth_segments.append([(x+size, y+size, z), (x+size, y+size, z+0.05)])
+        
+        for i, j in np.argwhere(state.data == -1):  # Player 2 (O)
+            x, y = j + 0.5, i + 0.5
+            # Draw O as a circle in 3D
+            circle_x = x + self.circle_dx
+            circle_y = y + self.circle_dy
+            circle_z = np.full_like(circle_x, z)
+            o_segments.append(np.column_stack([circle_x, circle_y, circle_z]))
+            # Add depth ring
+            o_depth_segments.append(np.column_stack([circle_x, circle_y, circle_z + 0.05]))
+        
+        self.x_pieces.set_segments(x_segments)
+        self.x_depth.set_segments(x_depth_segments)
+        self.o_pieces.set_segments(o_segments)
+        self.o_depth.set_segments(o_depth_segments)
+        
     def visualize_game(self, state):
         """Visualize a single game state"""
         self.draw_board_3d(state)
         plt.savefig(os.path.join(IMAGE_DIR, 'tic_tac_toe_3d.png'), dpi=150, bbox_inches='tight')
-        plt.show()
+        show_or_close(self.fig)
         
     def visualize_value_function(self):
         """Visualize the learned value function in 3D"""
@@ -105,46 +131,64 @@ class TicTacToe3D:
             print("No saved policy found. Please train first.")
             return
             
-        # Create 3D surface of value function
-        fig = plt.figure(figsize=(14, 10))
-        ax = fig.add_subplot(111, projection='3d')
-        
         # Get all non-terminal states
         states_3d = []
-        values = []
-        for hash_val in all_states:
-            state, is_end = all_states[hash_val]
-            if not is_end:
-                # Convert state to 3D coordinates (row, col, value)
-                # Find first empty position as representative
-                for i in range(3):
-                    for j in range(3):
-                        if state.data[i, j] == 0:
-                            states_3d.append([i, j, hash_val % 100])  # Use hash as z
-                            values.append(player.estimations.get(hash_val, 0.5))
-                            break
-                    else:
-                        continue
-                    break
+        hashes = []
+        for hash_val, (state, is_end) in all_states.items():
+            if is_end:
+                continue
+            # Convert state to 3D coordinates (row, col, value)
+            # Find first empty position as representative via its lowest set bit,
+            # a non-terminal state always has at least one
+            empty = state.empty_mask()
+            i, j = divmod((empty & -empty).bit_length() - 1, 3)
+            states_3d.append([i, j, hash_val % 100])  # Use hash as z
+            hashes.append(hash_val)
         
         if states_3d:
             states_3d = np.array(states_3d)
-            values = np.array(values)
+            # Values lie in [0, 1], half precision is plenty for colour mapping
+            values = np.fromiter((player.estimations.get(hash_val, 0.5) for hash_val in hashes),
+                                 dtype=np.float16, count=len(hashes))
+            
+            # Set FAST_3D=1 to render the point cloud with PyVista (VTK/OpenGL) if it is installed
+            if env_flag('FAST_3D'):
+                try:
+                    self.show_value_cloud_pyvista(states_3d, values)
+                    return
+                except ImportError:
+                    print("PyVista is not installed, falling back to matplotlib.")
+            
+            # Create 3D surface of value function
+            fig = plt.figure(figsize=(14, 10))
+            ax = fig.add_subplot(111, projection='3d')
             
             # Create surface
-            ax.scatter(states_3d[:, 0], states_3d[:, 1], states_3d[:, 2], 
-                      c=values, cmap='RdYlGn', s=50, alpha=0.7)
+            sc = ax.scatter(states_3d[:, 0], states_3d[:, 1], states_3d[:, 2], 
+                           c=values, cmap='RdYlGn', s=50, alpha=0.7)
             
             ax.set_xlabel('Row', fontsize=12)
             ax.set_ylabel('Column', fontsize=12)
             ax.set_zlabel('State Hash', fontsize=12)
             ax.set_title('3D Value Function Visualization', fontsize=14, fontweight='bold')
             
-            plt.colorbar(ax.scatter(states_3d[:, 0], states_3d[:, 1], states_3d[:, 2], 
-                                   c=values, cmap='RdYlGn', s=50, alpha=0.7), ax=ax)
+            plt.colorbar(sc, ax=ax)
             
             plt.savefig(os.path.join(IMAGE_DIR, 'tic_tac_toe_value_3d.png'), dpi=150, bbox_inches='tight')
-            plt.show()
+            show_or_close(fig)
+
+    def show_value_cloud_pyvista(self, states_3d, values):
+        """Show the value function point cloud with GPU-accelerated PyVista"""
+        import pyvista as pv
+        
+        cloud = pv.PolyData(states_3d.astype(np.float32))
+        cloud['values'] = values.astype(np.float32)
+        plotter = pv.Plotter()
+        plotter.add_mesh(cloud, scalars='values', cmap='RdYlGn', point_size=8,
+                         render_points_as_spheres=True)
+        plotter.show_grid(xtitle='Row', ytitle='Column', ztitle='State Hash')
+        plotter.add_title('3D Value Function Visualization')
+        plotter.show()
 
 
 def main():
@@ -153,10 +197,10 @@ def main():
     
     # Create a sample game state
     state = State()
-    state.data[0, 0] = 1   # X
-    state.data[0, 1] = -1  # O
-    state.data[1, 1] = 1   # X
-    state.data[1, 2] = -1  # O
+    state = state.next_state(0, 0, 1)   # X
+    state = state.next_state(0, 1, -1)  # O
+    state = state.next_state(1, 1, 1)   # X
+    state = state.next_state(1, 2, -1)  # O
     
     print("Visualizing sample game state...")
     visualizer.visualize_game(state)
@@ -5,23 +5,54 @@ Play against AI or watch AI vs AI in 3D
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
 from matplotlib.widgets import Button
 import os
 import sys
 import pickle
+import multiprocessing
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from chapter01.tic_tac_toe import State, Player, Judger, HumanPlayer, all_states, BOARD_ROWS, BOARD_COLS
+from plot_utils import BlitManager
 
 # Setup image directory path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGE_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'images')
 
+# Each worker learns only from its own share of the episodes, and the averaged tables of
+# many short runs play worse than one long run, so training uses at most this many workers
+MAX_TRAIN_WORKERS = 4
+
+def train_worker(args):
+    """Run self-play episodes on private players, returning both estimation tables"""
+    epochs, seed = args
+    np.random.seed(seed)
+    player1 = Player(epsilon=0.01)
+    player2 = Player(epsilon=0.01)
+    judger = Judger(player1, player2)
+    for i in range(epochs):
+        judger.play()
+        player1.backup()
+        player2.backup()
+        judger.reset()
+        if (i + 1) % 1000 == 0:
+            print(f"Training (worker {seed}): {i+1}/{epochs}", flush=True)
+    return player1.estimations, player2.estimations
+
+
+def merge_estimations(tables):
+    """Average estimation tables state by state"""
+    merged = {}
+    for table in tables:
+        for hash_val, value in table.items():
+            merged[hash_val] = merged.get(hash_val, 0.0) + value
+    return {hash_val: total / len(tables) for hash_val, total in merged.items()}
+
+
 class TicTacToe3DGame:
     def __init__(self, player_vs_ai=True):
-        self.fig = plt.figure(figsize=(14, 10))
-        self.ax = self.fig.add_subplot(111, projection='3d')
         self.current_state = State()
         self.player1 = None
         self.player2 = None
@@ -31,98 +62,97 @@ class TicTacToe3DGame:
         self.current_player = 1
         self.click_pos = None
         self.board_size = 3
+        self.grid_segments = self.build_grid_segments(self.board_size)
+        # O pieces are circles of radius 0.3, offsets relative to the cell centre
+        theta = np.linspace(0, 2*np.pi, 50)
+        self.circle_dx = 0.3 * np.cos(theta)
+        self.circle_dy = 0.3 * np.sin(theta)
+        self.timer = None
         
         # Setup game
         if player_vs_ai:
             self.player1 = HumanPlayer3D()
-            self.player2 = Player(epsilon=0)
-            try:
-                self.player2.load_policy()
-            except:
-                print("No saved policy found. Training AI first...")
-                self.train_ai()
-                self.player2 = Player(epsilon=0)
-                self.player2.load_policy()
+            self.player2 = CachedPlayer(epsilon=0)
         else:
-            self.player1 = Player(epsilon=0.1)
-            self.player2 = Player(epsilon=0.1)
-            try:
-                self.player1.load_policy()
-                self.player2.load_policy()
-            except:
-                print("No saved policies. Training AIs...")
-                self.train_ai()
-                self.player1 = Player(epsilon=0.1)
-                self.player2 = Player(epsilon=0.1)
-                self.player1.load_policy()
-                self.player2.load_policy()
+            self.player1 = CachedPlayer(epsilon=0.1)
+            self.player2 = CachedPlayer(epsilon=0.1)
         
         self.judger = Judger(self.player1, self.player2)
         self.judger.reset()
         
+        # Only train when there are no saved policies, so later games start immediately,
+        # and before the figure exists so the training processes never fork a live GUI backend
+        if not (os.path.exists('policy_first.bin') and os.path.exists('policy_second.bin')):
+            print("No saved policies found. Training AI first...")
+            self.train_ai()
+        # Load after the judger has assigned symbols, so each AI reads its own policy
+        # and set_symbol does not overwrite the loaded estimations
+        for player in (self.player1, self.player2):
+            if isinstance(player, Player):
+                player.load_policy()
+        
+        self.fig = plt.figure(figsize=(14, 10))
+        self.ax = self.fig.add_subplot(111, projection='3d')
+        self.setup_board()
+        self.blitter = BlitManager(self.ax, [self.x_pieces, self.o_pieces, self.status_text])
+        
         # Connect click event
         self.fig.canvas.mpl_connect('button_press_event', self.on_click)
         
-    def train_ai(self, epochs=10000):
-        """Train AI players"""
-        print("Training AI players...")
+    def train_ai(self, epochs=10000, workers=None):
+        """Train AI players, splitting the self-play episodes across up to MAX_TRAIN_WORKERS processes"""
+        workers = min(workers or os.cpu_count() or 1, MAX_TRAIN_WORKERS, epochs)
+        print(f"Training AI players with {workers} worker(s)...")
+        jobs = [(epochs // workers + (k < epochs % workers), k) for k in range(workers)]
+        if workers == 1:
+            results = [train_worker(jobs[0])]
+        else:
+            with multiprocessing.Pool(workers) as pool:
+                results = pool.map(train_worker, jobs)
+        
         player1 = Player(epsilon=0.01)
         player2 = Player(epsilon=0.01)
-        judger = Judger(player1, player2)
-        
-        for i in range(epochs):
-            winner = judger.play()
-            player1.backup()
-            player2.backup()
-            judger.reset()
-            if (i + 1) % 1000 == 0:
-                print(f"Training: {i+1}/{epochs}")
+        # save_policy names the file by symbol, player1 moves first
+        player1.set_symbol(1)
+        player2.set_symbol(-1)
+        player1.estimations = merge_estimations([result[0] for result in results])
+        player2.estimations = merge_estimations([result[1] for result in results])
         
         player1.save_policy()
         player2.save_policy()
         print("Training complete!")
         
-    def draw_board_3d(self):
-        """Draw the 3D tic-tac-toe board"""
-        self.ax.clear()
-        
-        spacing = 1.0
-        
-        # Draw grid lines
-        for i in range(self.board_size + 1):
+    @staticmethod
+    def build_grid_segments(board_size):
+        """Build the line segments of the board grid"""
+        segments = []
+        for i in range(board_size + 1):
             # Vertical lines
-            self.ax.plot([i, i], [0, self.board_size], [0, 0], 'k-', linewidth=3)
-            self.ax.plot([i, i], [0, self.board_size], [0.1, 0.1], 'k-', linewidth=3)
+            segments.append([(i, 0, 0), (i, board_size, 0)])
+            segments.append([(i, 0, 0.1), (i, board_size, 0.1)])
             # Horizontal lines
-            self.ax.plot([0, self.board_size], [i, i], [0, 0], 'k-', linewidth=3)
-            self.ax.plot([0, self.board_size], [i, i], [0.1, 0.1], 'k-', linewidth=3)
+            segments.append([(0, i, 0), (board_size, i, 0)])
+            segments.append([(0, i, 0.1), (board_size, i, 0.1)])
             # Vertical connectors
-            self.ax.plot([i, i], [0, 0], [0, 0.1], 'k-', linewidth=3)
-            self.ax.plot([i, i], [self.board_size, self.board_size], [0, 0.1], 'k-', linewidth=3)
+            segments.append([(i, 0, 0), (i, 0, 0.1)])
+            segments.append([(i, board_size, 0), (i, board_size, 0.1)])
+        return segments
         
-        # Draw pieces
-        for i in range(self.board_size):
-            for j in range(self.board_size):
-                x, y = j + 0.5, i + 0.5
-                z = 0.05
-                
-                if self.current_state.data[i, j] == 1:  # Player 1 (X)
-                    size = 0.3
-                    self.ax.plot([x-size, x+size], [y-size, y+size], [z, z], 'r-', linewidth=5)
-                    self.ax.plot([x-size, x+size], [y+size, y-size], [z, z], 'r-', linewidth=5)
-                elif self.current_state.data[i, j] == -1:  # Player 2 (O)
-                    theta = np.linspace(0, 2*np.pi, 50)
-                    radius = 0.3
-                    circle_x = x + radius * np.cos(theta)
-                    circle_y = y + radius * np.sin(theta)
-                    circle_z = np.full_like(theta, z)
-                    self.ax.plot(circle_x, circle_y, circle_z, 'b-', linewidth=5)
+    def setup_board(self):
+        """Create the static board and the persistent piece and status artists"""
+        # Draw grid lines
+        self.ax.add_collection3d(Line3DCollection(self.grid_segments, colors='k', linewidths=3))
+        
+        # Pieces and status are animated so moves can be blitted over the cached board
+        self.x_pieces = Line3DCollection([], colors='r', linewidths=5, animated=True)
+        self.o_pieces = Line3DCollection([], colors='b', linewidths=5, animated=True)
+        self.ax.add_collection(self.x_pieces)
+        self.ax.add_collection(self.o_pieces)
         
         # Add status text
-        status = self.get_status_text()
-        self.ax.text2D(0.05, 0.95, status, transform=self.ax.transAxes, 
-                       fontsize=14, verticalalignment='top',
-                       bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
+        self.status_text = self.ax.text2D(0.05, 0.95, '', transform=self.ax.transAxes, 
+                                          fontsize=14, verticalalignment='top', animated=True,
+                                          bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
         
         # Set labels and title
         self.ax.set_xlabel('Column', fontsize=12)
@@ -139,8 +169,37 @@ class TicTacToe3DGame:
         # Set viewing angle
         self.ax.view_init(elev=30, azim=45)
         
-        plt.tight_layout()
+    def draw_board_3d(self):
+        """Update the pieces and status text to the current state"""
+        x_segments, o_segments = self.piece_segments()
+        self.x_pieces.set_segments(x_segments)
+        self.o_pieces.set_segments(o_segments)
+        self.status_text.set_text(self.get_status_text())
+        
+    def piece_segments(self):
+        """Collect piece segments so each player is drawn as a single artist"""
+        x_segments, o_segments = [], []
+        z = 0.05
+        size = 0.3
         
+        for i, j in np.argwhere(self.current_state.data == 1):  # Player 1 (X)
+            x, y = j + 0.5, i + 0.5
+            x_segments.append([(x-size, y-size, z), (x+size, y+size, z)])
+            x_segments.append([(x-size, y+size, z), (x+size, y-size, z)])
+        
+        for i, j in np.argwhere(self.current_state.data == -1):  # Player 2 (O)
+            x, y = j + 0.5, i + 0.5
+            circle_x = x + self.circle_dx
+            circle_y = y + self.circle_dy
+            circle_z = np.full_like(circle_x, z)
+            o_segments.append(np.column_stack([circle_x, circle_y, circle_z]))
+        return x_segments, o_segments
+    
+    def update_board(self):
+        """Update pieces and status, blitting them over the cached background"""
+        self.draw_board_3d()
+        self.blitter.update()
+    
     def get_status_text(self):
         """Get status text for display"""
         if self.game_over:
@@ -185,15 +244,10 @@ class TicTacToe3DGame:
                 self.player1.set_state(self.current_state)
                 self.player2.set_state(self.current_state)
                 
-                # Check if game is over
+                # Check if game is over, otherwise let the AI move
                 if self.current_state.is_end():
                     self.game_over = True
-                    self.draw_board_3d()
-                    plt.draw()
-                    return
-                
-                # AI move
-                if not self.current_state.is_end():
+                else:
                     i, j, symbol = self.player2.act()
                     new_state = self.current_state.next_state(i, j, symbol)
                     self.current_state = new_state
@@ -203,48 +257,47 @@ class TicTacToe3DGame:
                     if self.current_state.is_end():
                         self.game_over = True
                 
-                self.draw_board_3d()
-                plt.draw()
+                self.update_board()
     
-    def play_ai_vs_ai(self):
-        """Play AI vs AI automatically"""
+    def play_ai_vs_ai(self, interval=200):
+        """Play AI vs AI automatically, one move every interval milliseconds
+        With interval=None the whole game is played at once, without animation
+        """
         self.current_state = State()
         self.player1.set_state(self.current_state)
         self.player2.set_state(self.current_state)
         self.game_over = False
+        self.current_player = 1
         
-        while not self.game_over:
-            # Player 1 move
-            i, j, symbol = self.player1.act()
-            new_state = self.current_state.next_state(i, j, symbol)
-            self.current_state = new_state
-            self.player1.set_state(self.current_state)
-            self.player2.set_state(self.current_state)
-            
-            self.draw_board_3d()
-            plt.draw()
-            plt.pause(0.5)
-            
-            if self.current_state.is_end():
-                self.game_over = True
-                break
-            
-            # Player 2 move
-            i, j, symbol = self.player2.act()
-            new_state = self.current_state.next_state(i, j, symbol)
-            self.current_state = new_state
-            self.player1.set_state(self.current_state)
-            self.player2.set_state(self.current_state)
-            
-            self.draw_board_3d()
-            plt.draw()
-            plt.pause(0.5)
-            
-            if self.current_state.is_end():
-                self.game_over = True
+        if interval is None:
+            while not self.game_over:
+                self.advance_move()
+            return
         
-        self.draw_board_3d()
-        plt.draw()
+        # Drive the game from the GUI event loop instead of sleeping between moves
+        self.timer = self.fig.canvas.new_timer(interval=interval)
+        self.timer.add_callback(self.advance_move)
+        self.timer.start()
+    
+    def advance_move(self):
+        """Let the AI whose turn it is make one move"""
+        if self.game_over:
+            return
+        player = self.player1 if self.current_player == 1 else self.player2
+        i, j, symbol = player.act()
+        new_state = self.current_state.next_state(i, j, symbol)
+        self.current_state = new_state
+        self.player1.set_state(self.current_state)
+        self.player2.set_state(self.current_state)
+        
+        if self.current_state.is_end():
+            self.game_over = True
+            if self.timer is not None:
+                self.timer.stop()
+        else:
+            self.current_player = -self.current_player
+        
+        self.update_board()
     
     def reset_game(self):
         """Reset the game"""
@@ -253,8 +306,7 @@ class TicTacToe3DGame:
         self.player2.set_state(self.current_state)
         self.game_over = False
         self.current_player = 1
-        self.draw_board_3d()
-        plt.draw()
+        self.update_board()
     
     def run(self):
         """Run the game"""
@@ -270,6 +322,38 @@ class TicTacToe3DGame:
             plt.show()
 
 
+class CachedPlayer(Player):
+    """AI player that memoizes its candidate moves by state hash
+    Estimations do not change during play, so the best moves of a state are computed once
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.move_cache = {}
+    
+    def load_policy(self):
+        super().load_policy()
+        self.move_cache = {}
+    
+    def act(self):
+        state = self.states[-1]
+        key = state.hash()
+        if key not in self.move_cache:
+            positions = [divmod(int(cell), BOARD_COLS) for cell in np.flatnonzero(state.data == 0)]
+            values = [self.estimations[state.next_state(i, j, self.symbol).hash()] for i, j in positions]
+            best_value = max(values)
+            best = [pos for pos, value in zip(positions, values) if value == best_value]
+            self.move_cache[key] = (positions, best)
+        positions, best = self.move_cache[key]
+        
+        if np.random.rand() < self.epsilon:
+            i, j = positions[np.random.randint(len(positions))]
+            self.greedy[-1] = False
+        else:
+            # Break ties at random, as Player.act does
+            i, j = best[np.random.randint(len(best))] if len(best) > 1 else best[0]
+        return i, j, self.symbol
+
+
 class HumanPlayer3D:
     """Human player for 3D game (uses click events)"""
     def __init__(self):
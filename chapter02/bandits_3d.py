@@ -3,15 +3,80 @@
 Shows reward distributions and learning progress in 3D
 """
 import numpy as np
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from plot_utils import show_or_close
+
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 from mpl_toolkits.mplot3d.art3d import Poly3DCollection
-import os
+from numba import njit
 
 # Setup image directory path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGE_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'images')
 
+# Maximum number of time points handed to plot_surface; longer histories are downsampled.
+# Raise for finer surfaces, lower for faster rendering.
+SURFACE_TIME_POINTS = 100
+
+
+@njit(cache=True)
+def _run_bandit(true_values, epsilon, seed, q_history, chosen, rewards):
+    """Run one epsilon-greedy sample-average bandit for len(chosen) steps
+    Writes the Q-value history (steps, n_arms), chosen arms and rewards into the given buffers
+    """
+    np.random.seed(seed)
+    n_arms = true_values.shape[0]
+    Q = np.zeros(n_arms)
+    N = np.zeros(n_arms)
+    
+    for t in range(chosen.shape[0]):
+        # Epsilon-greedy action selection
+        if np.random.random() < epsilon:
+            action = np.random.randint(0, n_arms)
+        else:
+            action = 0
+            for a in range(1, n_arms):
+                if Q[a] > Q[action]:
+                    action = a
+        
+        # Sample reward and update Q value
+        reward = np.random.standard_normal() + true_values[action]
+        N[action] += 1
+        Q[action] += (reward - Q[action]) / N[action]
+        
+        q_history[t] = Q
+        chosen[t] = action
+        rewards[t] = reward
+
+
+def _run_bandit_runs(true_values, n_runs, steps, epsilon):
+    """Run independent bandit runs side by side as NumPy lanes
+    Returns the chosen arms (n_runs, steps)
+    """
+    n_arms = true_values.shape[0]
+    Q = np.zeros((n_runs, n_arms))
+    N = np.zeros((n_runs, n_arms))
+    rows = np.arange(n_runs)
+    chosen = np.empty((n_runs, steps), dtype=np.int8)
+    
+    for t in range(steps):
+        # Epsilon-greedy action selection for every run at once
+        explore = np.random.rand(n_runs) < epsilon
+        action = np.where(explore, np.random.randint(n_arms, size=n_runs), Q.argmax(axis=1))
+        
+        # Sample-average update of the chosen arm in each run
+        reward = np.random.randn(n_runs) + true_values[action]
+        N[rows, action] += 1
+        Q[rows, action] += (reward - Q[rows, action]) / N[rows, action]
+        
+        chosen[:, t] = action
+    return chosen
+
 class Bandits3D:
     def __init__(self, n_arms=10):
         self.n_arms = n_arms
@@ -32,16 +97,20 @@ class Bandits3D:
         
         # Sample rewards for visualization
         n_samples = 200
-        rewards = []
+        all_rewards = np.random.randn(self.n_arms * n_samples) + np.repeat(true_values, n_samples)
+        arm_indices = np.repeat(np.arange(self.n_arms), n_samples)
+        
+        # Histogram all arms in one pass over shared reward bins
+        n_bins = 40
+        hists, _, bins = np.histogram2d(arm_indices, all_rewards,
+                                        bins=[np.arange(self.n_arms + 1) - 0.5, n_bins])
+        bin_centers = (bins[:-1] + bins[1:]) / 2
+        
+        # Create violin plot-like visualization in 3D, all bars in a single collection
+        all_verts = []
+        all_colors = []
         for i in range(self.n_arms):
-            arm_rewards = np.random.randn(n_samples) + true_values[i]
-            rewards.append(arm_rewards)
-        
-        # Create violin plot-like visualization in 3D
-        for i in range(self.n_arms):
-            # Create histogram data
-            hist, bins = np.histogram(rewards[i], bins=20)
-            bin_centers = (bins[:-1] + bins[1:]) / 2
+            hist = hists[i]
             
             # Normalize histogram for width
             max_hist = hist.max()
@@ -58,16 +127,17 @@ class Bandits3D:
                     y = [center - 0.1, center - 0.1, center + 0.1, center + 0.1]
                     z = [0, 0, height, height]
                     
-                    # Draw bar
-                    verts = [list(zip(x, y, z))]
-                    ax.add_collection3d(Poly3DCollection(verts, alpha=0.6, 
-                                                       facecolor=plt.cm.viridis(i/self.n_arms),
-                                                       edgecolor='black', linewidth=0.5))
+                    all_verts.append(list(zip(x, y, z)))
+                    all_colors.append(plt.cm.viridis(i/self.n_arms))
             
             # Mark true value
             ax.scatter([i], [true_values[i]], [0], c='red', s=100, marker='*', 
                       label='True Value' if i == 0 else '', zorder=10)
         
+        # Draw all bars
+        ax.add_collection3d(Poly3DCollection(all_verts, alpha=0.6, facecolors=all_colors,
+                                             edgecolor='black', linewidth=0.5))
+        
         ax.set_xlabel('Arm', fontsize=12)
         ax.set_ylabel('Reward', fontsize=12)
         ax.set_zlabel('Frequency', fontsize=12)
@@ -77,7 +147,7 @@ class Bandits3D:
         ax.view_init(elev=20, azim=45)
         
         plt.savefig(os.path.join(IMAGE_DIR, 'bandits_3d_distributions.png'), dpi=150, bbox_inches='tight')
-        plt.show()
+        show_or_close(fig)
         
     def visualize_learning_progress(self, steps=1000, epsilon=0.1):
         """Visualize learning progress over time in 3D"""
@@ -89,45 +159,18 @@ class Bandits3D:
         true_values = np.random.randn(self.n_arms)
         best_action = np.argmax(true_values)
         
-        # Initialize Q values
-        Q = np.zeros(self.n_arms)
-        N = np.zeros(self.n_arms)
+        # Run the epsilon-greedy learner into preallocated buffers
+        q_values_history = np.empty((steps, self.n_arms))
+        action_chosen = np.empty(steps, dtype=np.int64)
+        rewards_received = np.empty(steps)
+        _run_bandit(true_values, epsilon, np.random.randint(2**31), q_values_history, action_chosen,
+                    rewards_received)
+        time_steps = np.arange(steps)
         
-        # Track learning
-        time_steps = []
-        action_chosen = []
-        rewards_received = []
-        q_values_history = []
-        
-        for t in range(steps):
-            # Epsilon-greedy action selection
-            if np.random.rand() < epsilon:
-                action = np.random.randint(self.n_arms)
-            else:
-                action = np.argmax(Q)
-            
-            # Sample reward
-            reward = np.random.randn() + true_values[action]
-            
-            # Update Q value
-            N[action] += 1
-            Q[action] += (reward - Q[action]) / N[action]
-            
-            # Store data
-            time_steps.append(t)
-            action_chosen.append(action)
-            rewards_received.append(reward)
-            q_values_history.append(Q.copy())
-        
-        # Convert to arrays
-        time_steps = np.array(time_steps)
-        action_chosen = np.array(action_chosen)
-        rewards_received = np.array(rewards_received)
-        q_values_history = np.array(q_values_history)
-        
-        # Create 3D surface plot of Q values over time
-        X, Y = np.meshgrid(time_steps, range(self.n_arms))
-        Z = q_values_history.T
+        # Create 3D surface plot of Q values over time, downsampled in time
+        stride = max(1, steps // SURFACE_TIME_POINTS)
+        X, Y = np.meshgrid(time_steps[::stride], range(self.n_arms))
+        Z = q_values_history[::stride].T
         
         # Plot surface
         surf = ax.plot_surface(X, Y, Z, cmap='viridis', alpha=0.7, linewidth=0, antialiased=True)
@@ -146,7 +189,7 @@ class Bandits3D:
         
         plt.colorbar(surf, ax=ax, shrink=0.5, aspect=20)
         plt.savefig(os.path.join(IMAGE_DIR, 'bandits_3d_learning.png'), dpi=150, bbox_inches='tight')
-        plt.show()
+        show_or_close(fig)
         
     def visualize_action_selection_landscape(self, steps=1000):
         """Visualize the action selection landscape in 3D"""
@@ -159,34 +202,19 @@ class Bandits3D:
         
         # Simulate multiple runs
         n_runs = 10
-        selection_counts = np.zeros((n_runs, self.n_arms, steps))
+        chosen = _run_bandit_runs(true_values, n_runs, steps, 0.1)
         
-        for run in range(n_runs):
-            Q = np.zeros(self.n_arms)
-            N = np.zeros(self.n_arms)
-            
-            for t in range(steps):
-                # Epsilon-greedy
-                if np.random.rand() < 0.1:
-                    action = np.random.randint(self.n_arms)
-                else:
-                    action = np.argmax(Q)
-                
-                # Update
-                reward = np.random.randn() + true_values[action]
-                N[action] += 1
-                Q[action] += (reward - Q[action]) / N[action]
-                
-                selection_counts[run, action, t] = 1
-        
-        # Average across runs
-        avg_selections = selection_counts.mean(axis=0)
-        
-        # Create 3D bar plot
+        # Average across runs: fraction of runs choosing each arm at each step
+        avg_selections = (chosen[:, None, :] == np.arange(self.n_arms)[None, :, None]).mean(axis=0)
+        
+        # Create 3D bar plot, averaging selections over windows of stride steps
+        stride = max(1, steps // SURFACE_TIME_POINTS)
+        n_windows = steps // stride
+        windowed = avg_selections[:, :n_windows * stride].reshape(self.n_arms, n_windows, stride).mean(axis=2)
         x_pos = np.arange(self.n_arms)
-        y_pos = np.arange(steps)
+        y_pos = np.arange(n_windows) * stride
         X, Y = np.meshgrid(x_pos, y_pos)
-        Z = avg_selections.T
+        Z = windowed.T
         
         # Plot as surface
         ax.plot_surface(X, Y, Z, cmap='coolwarm', alpha=0.8, linewidth=0, antialiased=True)
@@ -198,7 +226,7 @@ class Bandits3D:
         ax.view_init(elev=30, azim=45)
         
         plt.savefig(os.path.join(IMAGE_DIR, 'bandits_3d_selection.png'), dpi=150, bbox_inches='tight')
-        plt.show()
+        show_or_close(fig)
 
 
 def main():
@@ -3,70 +3,151 @@
 Shows value functions and policies as 3D surfaces
 """
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
 import os
 import sys
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from plot_utils import FIGURE_DPI, reuse_figure, surface_edges, shared_figure, show_or_close
+
+import matplotlib.pyplot as plt
+from mpl_toolkits.mplot3d import Axes3D
+from numba import njit
+
 from chapter03.grid_world import step, ACTIONS, ACTION_PROB, DISCOUNT, WORLD_SIZE, A_POS, A_PRIME_POS, B_POS, B_PRIME_POS
 
 # Setup image directory path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGE_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'images')
 
+# converged value functions are cached on disk, bump the version when the dynamics or solver change
+VALUE_CACHE_VERSION = 4
+
+# Side of the square tiles a Bellman sweep walks the grid in, so the values a tile reads stay in cache
+SWEEP_TILE = 16
+
+
+@njit(cache=True)
+def _bellman_sweep(value, new_value, next_i, next_j, rewards, discount, action_prob, optimal, tile):
+    """One Bellman backup of every state from value into new_value, tile x tile block at a time
+    Evaluates the equiprobable policy, or takes the best action when optimal is True.
+    Passing the same array as value and new_value updates in place.
+    Returns the largest absolute change of any state.
+    """
+    height, width = value.shape
+    delta = 0.0
+    for i0 in range(0, height, tile):
+        for j0 in range(0, width, tile):
+            for i in range(i0, min(i0 + tile, height)):
+                for j in range(j0, min(j0 + tile, width)):
+                    backup = -np.inf if optimal else 0.0
+                    for a in range(rewards.shape[2]):
+                        q = rewards[i, j, a] + discount * value[next_i[i, j, a], next_j[i, j, a]]
+                        if optimal:
+                            backup = max(backup, q)
+                        else:
+                            backup += action_prob * q
+                    delta = max(delta, abs(backup - value[i, j]))
+                    new_value[i, j] = backup
+    return delta
+
+
 class Gridworld3D:
     def __init__(self):
         self.world_size = WORLD_SIZE
+        self.next_i, self.next_j, self.rewards = self.build_transition_tables()
+        # plot_surface grid, shared by every figure
+        self.X, self.Y = np.meshgrid(range(self.world_size), range(self.world_size))
+        
+    def build_transition_tables(self):
+        """Tabulate next row, next column and reward for every (row, column, action)"""
+        shape = (self.world_size, self.world_size, len(ACTIONS))
+        # Smallest integer type that holds a coordinate, and single precision rewards,
+        # so the tables take few cache lines
+        index_type = np.min_scalar_type(self.world_size - 1)
+        next_i = np.empty(shape, dtype=index_type)
+        next_j = np.empty(shape, dtype=index_type)
+        rewards = np.empty(shape, dtype=np.float32)
+        for i in range(self.world_size):
+            for j in range(self.world_size):
+                for a, action in enumerate(ACTIONS):
+                    (next_i[i, j, a], next_j[i, j, a]), rewards[i, j, a] = step([i, j], action)
+        return next_i, next_j, rewards
+    
+    def action_values(self, value):
+        """One-step lookahead values of every action in every state"""
+        return self.rewards + DISCOUNT * value[self.next_i, self.next_j]
         
     def compute_value_function(self):
         """Compute value function using policy evaluation"""
-        value = np.zeros((self.world_size, self.world_size))
-        while True:
-            new_value = np.zeros_like(value)
-            for i in range(self.world_size):
-                for j in range(self.world_size):
-                    for action in ACTIONS:
-                        (next_i, next_j), reward = step([i, j], action)
-                        new_value[i, j] += ACTION_PROB * (reward + DISCOUNT * value[next_i, next_j])
-            if np.sum(np.abs(value - new_value)) < 1e-4:
-                break
-            value = new_value
-        return value
+        return self.cached_values('random', optimal=False)
     
     def compute_optimal_value_function(self):
         """Compute optimal value function using value iteration"""
-        value = np.zeros((self.world_size, self.world_size))
+        return self.cached_values('optimal', optimal=True)
+    
+    def compute_greedy_policy(self, value):
+        """Greedy action index of every state, argmax takes the first if tie"""
+        return self.action_values(value).argmax(axis=-1)
+    
+    def cache_path(self, name):
+        """Disk cache file of a converged value function"""
+        return os.path.join(SCRIPT_DIR, f'value_cache_{name}_{self.world_size}_{DISCOUNT}_v{VALUE_CACHE_VERSION}.npy')
+    
+    def cached_values(self, name, optimal):
+        """Load a converged value function from disk, computing and saving it if missing"""
+        path = self.cache_path(name)
+        try:
+            return np.load(path)
+        except (OSError, ValueError):
+            # missing or unreadable cache
+            pass
+        value = self.iterate_values(optimal)
+        try:
+            np.save(path, value)
+        except OSError:
+            pass
+        return value
+    
+    def iterate_values(self, optimal, in_place=True):
+        """Repeat Bellman sweeps until no value changes by 1e-4 or more
+        In-place (Gauss-Seidel) sweeps reuse values updated earlier in the same sweep
+        and converge in fewer iterations than synchronous (Jacobi) sweeps.
+        """
+        # Single precision is ample for the 1e-4 tolerance
+        value = np.zeros((self.world_size, self.world_size), dtype=np.float32)
+        new_value = value if in_place else np.empty_like(value)
         while True:
-            new_value = np.zeros_like(value)
-            for i in range(self.world_size):
-                for j in range(self.world_size):
-                    values = []
-                    for action in ACTIONS:
-                        (next_i, next_j), reward = step([i, j], action)
-                        values.append(reward + DISCOUNT * value[next_i, next_j])
-                    new_value[i, j] = np.max(values)
-            if np.sum(np.abs(new_value - value)) < 1e-4:
+            delta = self.sweep(value, new_value, optimal)
+            value, new_value = new_value, value
+            if delta < 1e-4:
                 break
-            value = new_value
         return value
     
-    def visualize_value_surface(self, value_func=None, title="Value Function"):
-        """Visualize value function as a 3D surface"""
+    def sweep(self, value, new_value, optimal=False):
+        """Back up every state from value into new_value, returning the largest change"""
+        return _bellman_sweep(value, new_value, self.next_i, self.next_j, self.rewards,
+                              DISCOUNT, ACTION_PROB, optimal, SWEEP_TILE)
+    
+    def figure_axes(self, fig, figsize):
+        """3D axes on a new figure, or on fig after clearing it so one figure can be reused"""
+        fig = reuse_figure(fig, figsize)
+        return fig, fig.add_subplot(111, projection='3d')
+    
+    def visualize_value_surface(self, value_func=None, title="Value Function", fig=None):
+        """Visualize value function as a 3D surface, drawing on fig if given"""
         if value_func is None:
             value_func = self.compute_value_function()
             
-        fig = plt.figure(figsize=(14, 10))
-        ax = fig.add_subplot(111, projection='3d')
+        owns_fig = fig is None
+        fig, ax = self.figure_axes(fig, (14, 10))
         
-        # Create meshgrid
-        X, Y = np.meshgrid(range(self.world_size), range(self.world_size))
+        X, Y = self.X, self.Y
         Z = value_func
         
         # Plot surface
         surf = ax.plot_surface(X, Y, Z, cmap='viridis', alpha=0.9, 
-                               linewidth=0.5, antialiased=True, edgecolor='black')
+                               antialiased=True, rasterized=True, **surface_edges(max(Z.shape)))
         
         # Mark special states
         ax.scatter([A_POS[1]], [A_POS[0]], [value_func[A_POS[0], A_POS[1]]], 
@@ -85,45 +166,37 @@ class Gridworld3D:
         ax.legend()
         ax.view_init(elev=45, azim=45)
         
-        plt.colorbar(surf, ax=ax, shrink=0.5, aspect=20)
-        plt.savefig(os.path.join(IMAGE_DIR, f'gridworld_3d_{title.lower().replace(" ", "_")}.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+        fig.colorbar(surf, ax=ax, shrink=0.5, aspect=20)
+        fig.savefig(os.path.join(IMAGE_DIR, f'gridworld_3d_{title.lower().replace(" ", "_")}.png'), 
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        if owns_fig:
+            show_or_close(fig)
         
-    def visualize_policy_arrows_3d(self, value_func=None):
-        """Visualize policy as 3D arrows on the value surface"""
+    def visualize_policy_arrows_3d(self, value_func=None, best_actions=None, fig=None):
+        """Visualize policy as 3D arrows on the value surface, drawing on fig if given"""
         if value_func is None:
             value_func = self.compute_optimal_value_function()
+        if best_actions is None:
+            best_actions = self.compute_greedy_policy(value_func)
             
-        fig = plt.figure(figsize=(14, 10))
-        ax = fig.add_subplot(111, projection='3d')
+        owns_fig = fig is None
+        fig, ax = self.figure_axes(fig, (14, 10))
         
-        # Create meshgrid
-        X, Y = np.meshgrid(range(self.world_size), range(self.world_size))
+        X, Y = self.X, self.Y
         Z = value_func
         
         # Plot surface
         surf = ax.plot_surface(X, Y, Z, cmap='viridis', alpha=0.7, 
-                               linewidth=0.5, antialiased=True, edgecolor='black')
+                               antialiased=True, rasterized=True, **surface_edges(max(Z.shape)))
         
-        # Compute and draw policy arrows
+        # Draw policy arrows
         action_symbols = ['←', '↑', '→', '↓']
         action_offsets = [(0, -0.3), (-0.3, 0), (0, 0.3), (0.3, 0)]
         
-        for i in range(self.world_size):
-            for j in range(self.world_size):
-                # Find best action
-                values = []
-                for action in ACTIONS:
-                    (next_i, next_j), reward = step([i, j], action)
-                    values.append(reward + DISCOUNT * value_func[next_i, next_j])
-                best_actions = [idx for idx, val in enumerate(values) if val == max(values)]
-                best_action = best_actions[0]  # Take first if tie
-                
-                # Draw arrow
-                dx, dy = action_offsets[best_action]
-                ax.quiver(j, i, value_func[i, j], dx, dy, 0, 
-                         color='red', arrow_length_ratio=0.3, linewidth=2)
+        # Draw all arrows with a single quiver call
+        offsets = np.array(action_offsets)[best_actions]
+        ax.quiver(X.ravel(), Y.ravel(), value_func.ravel(), offsets[..., 0].ravel(), offsets[..., 1].ravel(),
+                  np.zeros(best_actions.size), color='red', arrow_length_ratio=0.3, linewidth=2)
         
         ax.set_xlabel('Column', fontsize=12)
         ax.set_ylabel('Row', fontsize=12)
@@ -131,43 +204,38 @@ class Gridworld3D:
         ax.set_title('3D Optimal Policy on Value Surface', fontsize=14, fontweight='bold')
         ax.view_init(elev=45, azim=45)
         
-        plt.colorbar(surf, ax=ax, shrink=0.5, aspect=20)
-        plt.savefig(os.path.join(IMAGE_DIR, 'gridworld_3d_policy.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+        fig.colorbar(surf, ax=ax, shrink=0.5, aspect=20)
+        fig.savefig(os.path.join(IMAGE_DIR, 'gridworld_3d_policy.png'), 
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        if owns_fig:
+            show_or_close(fig)
         
-    def visualize_convergence_3d(self):
-        """Visualize value function convergence over iterations in 3D"""
-        fig = plt.figure(figsize=(16, 12))
-        ax = fig.add_subplot(111, projection='3d')
+    def visualize_convergence_3d(self, max_iterations=20, n_frames=10, fig=None):
+        """Visualize value function convergence over iterations in 3D, drawing on fig if given"""
+        owns_fig = fig is None
+        fig, ax = self.figure_axes(fig, (16, 12))
         
-        value = np.zeros((self.world_size, self.world_size))
-        iteration = 0
+        # Only keep every stride-th sweep, the ones that get drawn
+        stride = max(1, (max_iterations + 1) // n_frames)
+        value = np.zeros((self.world_size, self.world_size), dtype=np.float32)
+        new_value = np.empty_like(value)
         value_history = []
         
-        while True:
-            new_value = np.zeros_like(value)
-            for i in range(self.world_size):
-                for j in range(self.world_size):
-                    for action in ACTIONS:
-                        (next_i, next_j), reward = step([i, j], action)
-                        new_value[i, j] += ACTION_PROB * (reward + DISCOUNT * value[next_i, next_j])
+        for iteration in range(max_iterations + 1):  # Limit iterations for visualization
+            delta = self.sweep(value, new_value)
             
-            value_history.append(value.copy())
-            if np.sum(np.abs(value - new_value)) < 1e-4:
-                break
-            value = new_value
-            iteration += 1
-            if iteration > 20:  # Limit iterations for visualization
+            if iteration % stride == 0:
+                value_history.append(value.copy())
+            if delta < 1e-4:
                 break
+            value, new_value = new_value, value
         
         # Create 3D visualization showing convergence
-        n_iterations = len(value_history)
-        for idx, val_func in enumerate(value_history[::max(1, n_iterations//10)]):  # Sample iterations
-            X, Y = np.meshgrid(range(self.world_size), range(self.world_size))
+        X, Y = self.X, self.Y
+        for idx, val_func in enumerate(value_history):
             Z = val_func
             ax.plot_surface(X, Y, Z + idx * 2, cmap='viridis', alpha=0.6, 
-                           linewidth=0.5, antialiased=True)
+                           linewidth=0.5, antialiased=True, rasterized=True)
         
         ax.set_xlabel('Column', fontsize=12)
         ax.set_ylabel('Row', fontsize=12)
@@ -175,28 +243,35 @@ class Gridworld3D:
         ax.set_title('3D Value Function Convergence', fontsize=14, fontweight='bold')
         ax.view_init(elev=30, azim=45)
         
-        plt.savefig(os.path.join(IMAGE_DIR, 'gridworld_3d_convergence.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+        fig.savefig(os.path.join(IMAGE_DIR, 'gridworld_3d_convergence.png'), 
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        if owns_fig:
+            show_or_close(fig)
 
 
 def main():
     """Main function to demonstrate 3D visualizations"""
     gridworld = Gridworld3D()
+    # Nothing is shown when headless, so draw every figure on one reused canvas
+    fig = shared_figure()
     
     print("Computing and visualizing random policy value function...")
     value_func = gridworld.compute_value_function()
-    gridworld.visualize_value_surface(value_func, "Random Policy Value Function")
+    gridworld.visualize_value_surface(value_func, "Random Policy Value Function", fig=fig)
     
     print("\nComputing and visualizing optimal value function...")
     optimal_value = gridworld.compute_optimal_value_function()
-    gridworld.visualize_value_surface(optimal_value, "Optimal Value Function")
+    optimal_policy = gridworld.compute_greedy_policy(optimal_value)
+    gridworld.visualize_value_surface(optimal_value, "Optimal Value Function", fig=fig)
     
     print("\nVisualizing policy on value surface...")
-    gridworld.visualize_policy_arrows_3d(optimal_value)
+    gridworld.visualize_policy_arrows_3d(optimal_value, optimal_policy, fig=fig)
     
     print("\nVisualizing convergence...")
-    gridworld.visualize_convergence_3d()
+    gridworld.visualize_convergence_3d(fig=fig)
+    
+    if fig is not None:
+        plt.close(fig)
 
 
 if __name__ == '__main__':
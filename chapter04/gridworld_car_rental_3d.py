@@ -3,37 +3,40 @@
 Includes Grid World, Car Rental, and Gambler's Problem
 """
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
 import os
 import sys
 
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from plot_utils import FIGURE_DPI, surface_edges, show_or_close
+
+import matplotlib.pyplot as plt
+from mpl_toolkits.mplot3d import Axes3D
+
 # Setup image directory path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGE_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'images')
 
-# Add parent directory for imports
-sys.path.insert(0, os.path.dirname(SCRIPT_DIR))
-
 
 class CarRental3D:
     """3D Visualization of Jack's Car Rental Problem"""
     
     def __init__(self, max_cars=20):
         self.max_cars = max_cars
+        # plot_surface grid, shared by every figure
+        self.X, self.Y = np.meshgrid(range(self.max_cars + 1), range(self.max_cars + 1))
         
     def visualize_policy_3d(self, policy):
         """Visualize car rental policy as 3D surface"""
         fig = plt.figure(figsize=(14, 10))
         ax = fig.add_subplot(111, projection='3d')
         
-        # Create meshgrid
-        X, Y = np.meshgrid(range(self.max_cars + 1), range(self.max_cars + 1))
+        X, Y = self.X, self.Y
         Z = policy
         
         # Plot surface
         surf = ax.plot_surface(X, Y, Z, cmap='RdYlGn', alpha=0.9,
-                               linewidth=0.5, antialiased=True, edgecolor='black')
+                               antialiased=True, rasterized=True, **surface_edges(max(Z.shape)))
         
         ax.set_xlabel('# Cars at Location 1', fontsize=12)
         ax.set_ylabel('# Cars at Location 2', fontsize=12)
@@ -43,21 +46,20 @@ class CarRental3D:
         
         plt.colorbar(surf, ax=ax, shrink=0.5, aspect=20)
         plt.savefig(os.path.join(IMAGE_DIR, 'car_rental_3d_policy.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        show_or_close(fig)
         
     def visualize_value_function_3d(self, values):
         """Visualize value function as 3D surface"""
         fig = plt.figure(figsize=(14, 10))
         ax = fig.add_subplot(111, projection='3d')
         
-        # Create meshgrid
-        X, Y = np.meshgrid(range(self.max_cars + 1), range(self.max_cars + 1))
+        X, Y = self.X, self.Y
         Z = values
         
         # Plot surface
         surf = ax.plot_surface(X, Y, Z, cmap='viridis', alpha=0.9,
-                               linewidth=0.5, antialiased=True, edgecolor='black')
+                               antialiased=True, rasterized=True, **surface_edges(max(Z.shape)))
         
         ax.set_xlabel('# Cars at Location 1', fontsize=12)
         ax.set_ylabel('# Cars at Location 2', fontsize=12)
@@ -67,8 +69,8 @@ class CarRental3D:
         
         plt.colorbar(surf, ax=ax, shrink=0.5, aspect=20)
         plt.savefig(os.path.join(IMAGE_DIR, 'car_rental_3d_value.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        show_or_close(fig)
 
 
 class GamblerProblem3D:
@@ -87,14 +89,14 @@ class GamblerProblem3D:
         states = np.arange(1, self.goal)
         values = state_values[1:-1]
         
-        # Create mesh for surface
-        X = states
-        Y = np.zeros_like(X)
+        # Bar anchors and footprints, shared by both plots
+        xs = states.astype(float)
+        zeros = np.zeros_like(xs)
+        widths = np.full_like(xs, 0.8)
         
-        # Plot as 3D bars
-        for i, (state, value) in enumerate(zip(states, values)):
-            ax1.bar3d(state, 0, 0, 0.8, 0.8, value, 
-                     color=plt.cm.viridis(value), alpha=0.8)
+        # Plot as 3D bars, all in a single call
+        ax1.bar3d(xs, zeros, zeros, widths, widths, values,
+                  color=plt.cm.viridis(values), alpha=0.8)
         
         ax1.set_xlabel('Capital', fontsize=12)
         ax1.set_ylabel('Iteration', fontsize=12)
@@ -111,9 +113,10 @@ class GamblerProblem3D:
             actions = np.arange(min(state, self.goal - state) + 1)
             policy[state] = actions[0]  # Simplified
         
-        for i, (state, stake) in enumerate(zip(states, policy[1:-1])):
-            ax2.bar3d(state, 0, 0, 0.8, 0.8, stake,
-                     color=plt.cm.plasma(stake / max(policy)), alpha=0.8)
+        stakes = policy[1:-1]
+        max_stake = policy.max()
+        colors = plt.cm.plasma(stakes / max_stake if max_stake > 0 else np.zeros_like(stakes))
+        ax2.bar3d(xs, zeros, zeros, widths, widths, stakes, color=colors, alpha=0.8)
         
         ax2.set_xlabel('Capital', fontsize=12)
         ax2.set_ylabel('Iteration', fontsize=12)
@@ -123,8 +126,8 @@ class GamblerProblem3D:
         
         plt.tight_layout()
         plt.savefig(os.path.join(IMAGE_DIR, 'gambler_3d_combined.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        show_or_close(fig)
 
 
 def main():
@@ -135,10 +138,8 @@ def main():
     car_rental = CarRental3D(max_cars=20)
     
     # Create sample policy (would normally come from training)
-    sample_policy = np.zeros((21, 21))
-    for i in range(21):
-        for j in range(21):
-            sample_policy[i, j] = (i - j) / 2  # Move cars from high to low
+    cars = np.arange(21)
+    sample_policy = (cars[:, None] - cars[None, :]) / 2  # Move cars from high to low
     
     # Create sample value function
     sample_values = np.random.randn(21, 21) * 50 + 100
@@ -151,9 +152,8 @@ def main():
     gambler = GamblerProblem3D(goal=100)
     
     # Create sample value function
-    state_values = np.zeros(101)
-    for i in range(1, 100):
-        state_values[i] = i / 100.0  # Simplified
+    state_values = np.arange(101) / 100.0  # Simplified
+    state_values[-1] = 0
     
     gambler.visualize_value_function_3d(state_values)
     
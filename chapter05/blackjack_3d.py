@@ -3,18 +3,21 @@
 Shows value functions and state distributions in 3D
 """
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
 import os
 import sys
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from plot_utils import FIGURE_DPI, surface_edges, show_or_close
+
+import matplotlib.pyplot as plt
+from mpl_toolkits.mplot3d import Axes3D
 
 # Setup image directory path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGE_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'images')
 
+
 class Blackjack3D:
     def __init__(self):
         # Blackjack state space dimensions
@@ -24,25 +27,25 @@ class Blackjack3D:
         self.player_sums = np.arange(12, 22)
         self.dealer_cards = np.arange(1, 11)
         self.usable_ace = [False, True]
+        # plot_surface grid, shared by every figure
+        self.X, self.Y = np.meshgrid(self.dealer_cards, self.player_sums)
         
     def visualize_state_space_3d(self):
         """Visualize the blackjack state space in 3D"""
         fig = plt.figure(figsize=(16, 12))
         ax = fig.add_subplot(111, projection='3d')
         
-        # Create meshgrid
-        X, Y = np.meshgrid(self.dealer_cards, self.player_sums)
+        X, Y = self.X, self.Y
         
         # Create sample value function (would be replaced with actual)
-        Z = np.zeros_like(X)
-        for i, player_sum in enumerate(self.player_sums):
-            for j, dealer_card in enumerate(self.dealer_cards):
-                # Sample value: higher for better player sums, lower for high dealer cards
-                Z[i, j] = (player_sum - 12) * 2 - dealer_card * 0.5
+        # Sample value: higher for better player sums, lower for high dealer cards
+        player_sums = self.player_sums.astype(float)
+        dealer_cards = self.dealer_cards.astype(float)
+        Z = (player_sums[:, None] - 12) * 2 - dealer_cards[None, :] * 0.5
         
         # Plot surface
         surf = ax.plot_surface(X, Y, Z, cmap='RdYlGn', alpha=0.8, 
-                               linewidth=0.5, antialiased=True, edgecolor='black')
+                               antialiased=True, rasterized=True, **surface_edges(max(Z.shape)))
         
         ax.set_xlabel('Dealer Showing Card', fontsize=12)
         ax.set_ylabel('Player Sum', fontsize=12)
@@ -52,27 +55,26 @@ class Blackjack3D:
         
         plt.colorbar(surf, ax=ax, shrink=0.5, aspect=20)
         plt.savefig(os.path.join(IMAGE_DIR, 'blackjack_3d_state_space.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        show_or_close(fig)
         
     def visualize_dual_ace_surfaces(self):
         """Visualize value functions for both usable ace scenarios"""
         fig = plt.figure(figsize=(18, 12))
+        player_sums = self.player_sums.astype(float)
+        dealer_cards = self.dealer_cards.astype(float)
         
         for ace_idx, has_ace in enumerate([False, True]):
             ax = fig.add_subplot(1, 2, ace_idx + 1, projection='3d')
             
-            X, Y = np.meshgrid(self.dealer_cards, self.player_sums)
-            Z = np.zeros_like(X)
+            X, Y = self.X, self.Y
             
-            for i, player_sum in enumerate(self.player_sums):
-                for j, dealer_card in enumerate(self.dealer_cards):
-                    # Adjust for usable ace
-                    effective_sum = player_sum + (10 if has_ace else 0)
-                    Z[i, j] = (effective_sum - 12) * 2 - dealer_card * 0.5
+            # Adjust for usable ace
+            effective_sums = player_sums + (10 if has_ace else 0)
+            Z = (effective_sums[:, None] - 12) * 2 - dealer_cards[None, :] * 0.5
             
             surf = ax.plot_surface(X, Y, Z, cmap='RdYlGn', alpha=0.8, 
-                                   linewidth=0.5, antialiased=True, edgecolor='black')
+                                   antialiased=True, rasterized=True, **surface_edges(max(Z.shape)))
             
             ax.set_xlabel('Dealer Showing Card', fontsize=12)
             ax.set_ylabel('Player Sum', fontsize=12)
@@ -85,26 +87,24 @@ class Blackjack3D:
         
         plt.tight_layout()
         plt.savefig(os.path.join(IMAGE_DIR, 'blackjack_3d_dual_ace.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        show_or_close(fig)
         
     def visualize_policy_3d(self, policy):
         """Visualize policy as 3D surface"""
         fig = plt.figure(figsize=(16, 12))
         ax = fig.add_subplot(111, projection='3d')
         
-        X, Y = np.meshgrid(self.dealer_cards, self.player_sums)
-        Z = np.zeros_like(X)
+        X, Y = self.X, self.Y
         
         # Convert policy to surface (0 = hit, 1 = stand)
-        for i, player_sum in enumerate(self.player_sums):
-            for j, dealer_card in enumerate(self.dealer_cards):
-                # Sample policy (would use actual policy)
-                Z[i, j] = 1 if player_sum >= 20 else 0
+        # Sample policy (would use actual policy)
+        stand = (self.player_sums >= 20).astype(float)
+        Z = np.broadcast_to(stand[:, None], X.shape)
         
         # Plot surface
         surf = ax.plot_surface(X, Y, Z, cmap='RdYlGn', alpha=0.8, 
-                               linewidth=0.5, antialiased=True, edgecolor='black')
+                               antialiased=True, rasterized=True, **surface_edges(max(Z.shape)))
         
         ax.set_xlabel('Dealer Showing Card', fontsize=12)
         ax.set_ylabel('Player Sum', fontsize=12)
@@ -114,8 +114,8 @@ class Blackjack3D:
         
         plt.colorbar(surf, ax=ax, shrink=0.5, aspect=20)
         plt.savefig(os.path.join(IMAGE_DIR, 'blackjack_3d_policy.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        show_or_close(fig)
 
 
 def main():
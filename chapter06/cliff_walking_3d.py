@@ -3,26 +3,93 @@
 Shows the agent's path and Q-values in 3D
 """
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection
 import os
 import sys
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from chapter06.cliff_walking import step, ACTIONS, START, GOAL, WORLD_HEIGHT, WORLD_WIDTH
+from plot_utils import FIGURE_DPI, FLOOR_LUT, surface_edges, show_or_close
+
+import matplotlib.pyplot as plt
+from mpl_toolkits.mplot3d import Axes3D
+from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+from numba import njit
+
+from chapter06.cliff_walking import (ACTIONS, ACTION_UP, ACTION_DOWN, ACTION_LEFT, ACTION_RIGHT,
+                                     START, GOAL, WORLD_HEIGHT, WORLD_WIDTH)
 
 # Setup image directory path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGE_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'images')
 
+
+@njit(cache=True)
+def _step(i, j, action, start_i, start_j):
+    """chapter06.cliff_walking.step on plain coordinates, returns next row, next column and reward"""
+    if action == ACTION_UP:
+        next_i, next_j = max(i - 1, 0), j
+    elif action == ACTION_LEFT:
+        next_i, next_j = i, max(j - 1, 0)
+    elif action == ACTION_RIGHT:
+        next_i, next_j = i, min(j + 1, WORLD_WIDTH - 1)
+    else:
+        next_i, next_j = min(i + 1, WORLD_HEIGHT - 1), j
+    
+    reward = -1
+    if (action == ACTION_DOWN and i == 2 and 1 <= j <= 10) or (
+            action == ACTION_RIGHT and i == start_i and j == start_j):
+        reward = -100
+        next_i, next_j = start_i, start_j
+    return next_i, next_j, reward
+
+
+@njit(cache=True)
+def _rollout(q_value, start_i, start_j, goal_i, goal_j, epsilon, seed, path):
+    """Run one epsilon-greedy episode for at most len(path) - 1 steps
+    Writes the visited (row, column) states into path, returns how many were written and the total reward
+    """
+    np.random.seed(seed)
+    n_actions = q_value.shape[2]
+    i, j = start_i, start_j
+    path[0, 0] = i
+    path[0, 1] = j
+    length = 1
+    total_reward = 0
+    
+    while length < path.shape[0] and not (i == goal_i and j == goal_j):
+        # Choose action
+        if np.random.random() < epsilon:
+            action = np.random.randint(0, n_actions)
+        else:
+            # Greedy action, ties broken uniformly at random by reservoir sampling
+            action = 0
+            n_best = 1
+            for a in range(1, n_actions):
+                if q_value[i, j, a] > q_value[i, j, action]:
+                    action = a
+                    n_best = 1
+                elif q_value[i, j, a] == q_value[i, j, action]:
+                    n_best += 1
+                    if np.random.randint(0, n_best) == 0:
+                        action = a
+        
+        # Take step
+        i, j, reward = _step(i, j, action, start_i, start_j)
+        path[length, 0] = i
+        path[length, 1] = j
+        length += 1
+        total_reward += reward
+    return length, total_reward
+
+
 class CliffWalking3D:
     def __init__(self):
         self.world_height = WORLD_HEIGHT
         self.world_width = WORLD_WIDTH
         self.start = START
         self.goal = GOAL
+        # plot_surface grid, shared by every figure
+        self.X, self.Y = np.meshgrid(range(self.world_width), range(self.world_height))
         
     def visualize_environment_3d(self):
         """Visualize the cliff walking environment in 3D"""
@@ -30,20 +97,16 @@ class CliffWalking3D:
         ax = fig.add_subplot(111, projection='3d')
         
         # Create grid
-        X, Y = np.meshgrid(range(self.world_width), range(self.world_height))
+        X, Y = self.X, self.Y
         Z = np.zeros_like(X)
         
         # Mark cliff area (row 2, columns 1-10)
         cliff_mask = np.zeros_like(Z, dtype=bool)
         cliff_mask[2, 1:11] = True
         
-        # Create surface with different colors for cliff
-        colors = np.ones_like(Z)
-        colors[cliff_mask] = 0.3  # Darker for cliff
-        
-        # Plot surface
-        ax.plot_surface(X, Y, Z, facecolors=plt.cm.RdYlGn(colors), 
-                       alpha=0.7, linewidth=0.5, antialiased=True)
+        # Plot surface, darker for cliff
+        ax.plot_surface(X, Y, Z, facecolors=FLOOR_LUT[cliff_mask.astype(np.uint8)], 
+                       alpha=0.7, linewidth=0, antialiased=False, rasterized=True)
         
         # Mark start position
         ax.scatter([self.start[1]], [self.start[0]], [0.1], 
@@ -68,33 +131,16 @@ class CliffWalking3D:
         ax.view_init(elev=60, azim=45)
         
         plt.savefig(os.path.join(IMAGE_DIR, 'cliff_walking_3d_environment.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        show_or_close(fig)
         
-    def simulate_episode(self, q_value, epsilon=0.1):
+    def simulate_episode(self, q_value, epsilon=0.1, max_steps=1000):
         """Simulate one episode and return the path"""
-        state = self.start.copy()
-        path = [state.copy()]
-        total_reward = 0
-        
-        while state != self.goal:
-            # Choose action
-            if np.random.rand() < epsilon:
-                action = np.random.choice(ACTIONS)
-            else:
-                values = q_value[state[0], state[1], :]
-                action = np.random.choice([a for a, v in enumerate(values) if v == np.max(values)])
-            
-            # Take step
-            next_state, reward = step(state, action)
-            path.append(next_state.copy())
-            total_reward += reward
-            state = next_state
-            
-            if len(path) > 1000:  # Safety limit
-                break
-                
-        return path, total_reward
+        path = np.empty((max_steps + 1, 2), dtype=np.int64)
+        # Seed the compiled rollout from the global generator so np.random.seed still applies
+        length, total_reward = _rollout(q_value, self.start[0], self.start[1], self.goal[0], self.goal[1],
+                                        epsilon, np.random.randint(2 ** 31), path)
+        return [tuple(state) for state in path[:length].tolist()], total_reward
         
     def visualize_path_3d(self, path, title="Agent Path"):
         """Visualize agent's path in 3D"""
@@ -102,25 +148,25 @@ class CliffWalking3D:
         ax = fig.add_subplot(111, projection='3d')
         
         # Create environment
-        X, Y = np.meshgrid(range(self.world_width), range(self.world_height))
+        X, Y = self.X, self.Y
         Z = np.zeros_like(X)
         cliff_mask = np.zeros_like(Z, dtype=bool)
         cliff_mask[2, 1:11] = True
-        colors = np.ones_like(Z)
-        colors[cliff_mask] = 0.3
         
-        ax.plot_surface(X, Y, Z, facecolors=plt.cm.RdYlGn(colors), 
-                       alpha=0.5, linewidth=0.5, antialiased=True)
+        ax.plot_surface(X, Y, Z, facecolors=FLOOR_LUT[cliff_mask.astype(np.uint8)], 
+                       alpha=0.5, linewidth=0, antialiased=False, rasterized=True)
         
         # Extract path coordinates
         if path:
-            path_x = [p[1] for p in path]
-            path_y = [p[0] for p in path]
-            path_z = [0.1 + i * 0.01 for i in range(len(path))]  # Slight elevation
+            points = np.asarray(path)
+            steps = np.arange(len(points))
+            path_x = points[:, 1]
+            path_y = points[:, 0]
+            path_z = 0.1 + 0.01 * steps  # Slight elevation
             
             # Plot path
             ax.plot(path_x, path_y, path_z, 'b-', linewidth=3, label='Agent Path', zorder=5)
-            ax.scatter(path_x, path_y, path_z, c=range(len(path)), 
+            ax.scatter(path_x, path_y, path_z, c=steps, 
                       cmap='cool', s=50, alpha=0.8, zorder=6)
             
             # Mark start and end
@@ -141,49 +187,56 @@ class CliffWalking3D:
         ax.view_init(elev=60, azim=45)
         
         plt.savefig(os.path.join(IMAGE_DIR, f'cliff_walking_3d_{title.lower().replace(" ", "_")}.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        show_or_close(fig)
+        
+    def draw_q_action(self, ax, q_value, action_idx, action_name):
+        """Draw the Q-value surface of one action on the given axes and return it
+        All actions share one colour scale, so a single colorbar describes every panel.
+        """
+        # Extract Q-values for this action
+        Q_action = q_value[:, :, action_idx]
+        
+        X, Y = self.X, self.Y
+        Z = Q_action
+        
+        # Plot surface
+        surf = ax.plot_surface(X, Y, Z, cmap='viridis', alpha=0.8, vmin=q_value.min(), vmax=q_value.max(),
+                             antialiased=True, rasterized=True, **surface_edges(max(Z.shape)))
+        
+        # Mark special positions
+        ax.scatter([self.start[1]], [self.start[0]], 
+                  [Q_action[self.start[0], self.start[1]]], 
+                  c='green', s=200, marker='o', zorder=10)
+        ax.scatter([self.goal[1]], [self.goal[0]], 
+                  [Q_action[self.goal[0], self.goal[1]]], 
+                  c='red', s=200, marker='*', zorder=10)
+        
+        ax.set_xlabel('Column', fontsize=10)
+        ax.set_ylabel('Row', fontsize=10)
+        ax.set_zlabel('Q-Value', fontsize=10)
+        ax.set_title(f'Q-Values for Action: {action_name}', fontsize=12, fontweight='bold')
+        ax.view_init(elev=45, azim=45)
+        return surf
         
     def visualize_q_values_3d(self, q_value):
         """Visualize Q-values as 3D surface for each action"""
-        fig = plt.figure(figsize=(18, 12))
-        
         action_names = ['Up', 'Down', 'Left', 'Right']
+        path = os.path.join(IMAGE_DIR, 'cliff_walking_3d_q_values.png')
+        
+        fig = plt.figure(figsize=(18, 12))
+        axes = []
         
         for action_idx, action_name in enumerate(action_names):
             ax = fig.add_subplot(2, 2, action_idx + 1, projection='3d')
-            
-            # Extract Q-values for this action
-            Q_action = q_value[:, :, action_idx]
-            
-            # Create meshgrid
-            X, Y = np.meshgrid(range(self.world_width), range(self.world_height))
-            Z = Q_action
-            
-            # Plot surface
-            surf = ax.plot_surface(X, Y, Z, cmap='viridis', alpha=0.8, 
-                                 linewidth=0.5, antialiased=True, edgecolor='black')
-            
-            # Mark special positions
-            ax.scatter([self.start[1]], [self.start[0]], 
-                      [Q_action[self.start[0], self.start[1]]], 
-                      c='green', s=200, marker='o', zorder=10)
-            ax.scatter([self.goal[1]], [self.goal[0]], 
-                      [Q_action[self.goal[0], self.goal[1]]], 
-                      c='red', s=200, marker='*', zorder=10)
-            
-            ax.set_xlabel('Column', fontsize=10)
-            ax.set_ylabel('Row', fontsize=10)
-            ax.set_zlabel('Q-Value', fontsize=10)
-            ax.set_title(f'Q-Values for Action: {action_name}', fontsize=12, fontweight='bold')
-            ax.view_init(elev=45, azim=45)
-            
-            plt.colorbar(surf, ax=ax, shrink=0.6, aspect=20)
+            surf = self.draw_q_action(ax, q_value, action_idx, action_name)
+            axes.append(ax)
         
         plt.tight_layout()
-        plt.savefig(os.path.join(IMAGE_DIR, 'cliff_walking_3d_q_values.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+        # One colorbar for all four panels
+        fig.colorbar(surf, ax=axes, shrink=0.6, aspect=30)
+        plt.savefig(path, dpi=FIGURE_DPI, bbox_inches='tight')
+        show_or_close(fig)
 
 
 def main():
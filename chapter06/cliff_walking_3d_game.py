@@ -5,6 +5,7 @@ Control the agent with arrow keys to navigate the cliff
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
+from mpl_toolkits.mplot3d.art3d import Line3DCollection, Poly3DCollection
 from matplotlib.widgets import Button
 import os
 import sys
@@ -12,27 +13,48 @@ import sys
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from chapter06.cliff_walking import step, ACTIONS, START, GOAL, WORLD_HEIGHT, WORLD_WIDTH
+from plot_utils import FLOOR_LUT, BlitManager, bar_faces, floor_faces
 
 # Setup image directory path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGE_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'images')
 
+# Initial length of the path buffer, it doubles whenever a long episode fills it
+PATH_CAPACITY = 256
+# Height of the path above the floor at its start, and how much it rises per move
+PATH_BASE = 0.1
+PATH_RISE = 0.01
+
 class CliffWalking3DGame:
-    def __init__(self):
+    def __init__(self, auto_frame_stride=10):
         self.fig = plt.figure(figsize=(16, 12))
         self.ax = self.fig.add_subplot(111, projection='3d')
         self.world_height = WORLD_HEIGHT
         self.world_width = WORLD_WIDTH
         self.state = START.copy()
-        self.path = [START.copy()]
+        # Visited states as the (column, row, height) points they are drawn at,
+        # preallocated so a move only writes one row
+        self.path = np.empty((PATH_CAPACITY, 3))
+        self.path_length = 0
+        self.record_state()
         self.total_reward = 0
         self.steps = 0
         self.game_over = False
         self.auto_mode = False
+        # Auto-play moves simulated per drawn frame
+        self.auto_frame_stride = auto_frame_stride
+        self.rng = np.random.default_rng()
+        
+        self.setup_environment_3d()
+        self.blitter = BlitManager(self.ax, [self.path_segments, self.current_marker, self.status_text])
         
         # Connect keyboard events
         self.fig.canvas.mpl_connect('key_press_event', self.on_key_press)
         
+        # Drive auto-play from the GUI event loop, auto_frame_stride moves and one draw per tick, instead of sleeping between moves
+        self.auto_timer = self.fig.canvas.new_timer(interval=300)
+        self.auto_timer.add_callback(self.auto_play)
+        
         # Create control buttons
         ax_reset = plt.axes([0.7, 0.05, 0.1, 0.04])
         self.btn_reset = Button(ax_reset, 'Reset')
@@ -42,29 +64,20 @@ class CliffWalking3DGame:
         self.btn_auto = Button(ax_auto, 'Auto Play')
         self.btn_auto.on_clicked(self.toggle_auto)
         
-    def draw_environment_3d(self):
-        """Draw the 3D cliff walking environment"""
-        self.ax.clear()
-        
-        # Create grid
-        X, Y = np.meshgrid(range(self.world_width), range(self.world_height))
-        Z = np.zeros_like(X)
-        
+    def setup_environment_3d(self):
+        """Draw the static 3D cliff walking environment and create the persistent game artists"""
         # Mark cliff area (row 2, columns 1-10)
-        cliff_mask = np.zeros_like(Z, dtype=bool)
+        cliff_mask = np.zeros((self.world_height, self.world_width), dtype=bool)
         cliff_mask[2, 1:11] = True
         
-        # Create surface with different colors
-        colors = np.ones_like(Z)
-        colors[cliff_mask] = 0.3
-        
-        # Plot surface
-        self.ax.plot_surface(X, Y, Z, facecolors=plt.cm.RdYlGn(colors), 
-                       alpha=0.7, linewidth=0.5, antialiased=True)
+        # Plot the flat floor as one collection of cells, darker over the cliff
+        cell_colors = FLOOR_LUT[cliff_mask[:-1, :-1].astype(np.uint8)].reshape(-1, 4)
+        self.ax.add_collection3d(Poly3DCollection(floor_faces(*cliff_mask.shape), facecolors=cell_colors,
+                                                  alpha=0.7, linewidth=0, antialiased=False, shade=True))
         
-        # Mark cliff with red bars
-        for j in range(1, 11):
-            self.ax.bar3d(j, 2, 0, 0.8, 0.8, -0.5, color='red', alpha=0.8)
+        # Mark cliff with red bars, all in a single collection
+        self.ax.add_collection3d(Poly3DCollection(bar_faces(np.arange(1, 11), 2, 0, 0.8, 0.8, -0.5),
+                                                  facecolors='red', alpha=0.8, shade=True))
         
         # Mark start position
         self.ax.scatter([START[1]], [START[0]], [0.1], 
@@ -74,31 +87,15 @@ class CliffWalking3DGame:
         self.ax.scatter([GOAL[1]], [GOAL[0]], [0.1], 
                   c='blue', s=500, marker='*', label='Goal', zorder=10)
         
-        # Draw path
-        if len(self.path) > 1:
-            path_x = [p[1] for p in self.path]
-            path_y = [p[0] for p in self.path]
-            path_z = [0.1 + i * 0.01 for i in range(len(self.path))]
-            
-            self.ax.plot(path_x, path_y, path_z, 'b-', linewidth=3, label='Path', zorder=5)
-            self.ax.scatter(path_x, path_y, path_z, c=range(len(self.path)), 
-                      cmap='cool', s=100, alpha=0.8, zorder=6)
-        
-        # Mark current position
-        self.ax.scatter([self.state[1]], [self.state[0]], [0.2], 
-                  c='yellow', s=600, marker='D', label='Current', zorder=10, edgecolors='black', linewidths=2)
-        
-        # Add status text
-        status = f"Steps: {self.steps} | Reward: {self.total_reward} | Position: ({self.state[0]}, {self.state[1]})"
-        if self.game_over:
-            if self.state == GOAL:
-                status += " | Goal Reached!"
-            else:
-                status += " | Fell off cliff!"
-        
-        self.ax.text2D(0.05, 0.95, status, transform=self.ax.transAxes, 
-                       fontsize=12, verticalalignment='top',
-                       bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.8))
+        # Path, current position and status are animated so moves can be blitted over the cached scene
+        self.path_segments = Line3DCollection([], cmap='cool', linewidth=3, label='Path', zorder=5, animated=True)
+        self.ax.add_collection3d(self.path_segments, autolim=False)
+        self.current_marker = self.ax.scatter([START[1]], [START[0]], [0.2],
+                  c='yellow', s=600, marker='D', label='Current', zorder=10, edgecolors='black', linewidths=2,
+                  animated=True)
+        self.status_text = self.ax.text2D(0.05, 0.95, '', transform=self.ax.transAxes,
+                                          fontsize=12, verticalalignment='top', animated=True,
+                                          bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.8))
         
         self.ax.set_xlabel('Column', fontsize=12)
         self.ax.set_ylabel('Row', fontsize=12)
@@ -109,8 +106,33 @@ class CliffWalking3DGame:
         self.ax.set_zlim([-0.6, 0.5])
         self.ax.legend(loc='upper right')
         self.ax.view_init(elev=60, azim=45)
+    
+    def draw_environment_3d(self):
+        """Update the path, current position and status text to the game state"""
+        # Draw path as one segment per move, colored by when it was taken
+        points = self.path[:self.path_length]
+        self.path_segments.set_segments(np.stack([points[:-1], points[1:]], axis=1))
+        # Heights grow linearly with the step, so they order the colors directly
+        self.path_segments.set_array(points[:-1, 2])
+        self.path_segments.set_clim(PATH_BASE, PATH_BASE + PATH_RISE * max(len(points) - 2, 1))
         
-        plt.tight_layout()
+        # Mark current position
+        self.current_marker.set_offsets([[self.state[1], self.state[0]]])
+        self.current_marker.set_3d_properties([0.2], 'z')
+        
+        # Add status text
+        status = f"Steps: {self.steps} | Reward: {self.total_reward} | Position: ({self.state[0]}, {self.state[1]})"
+        if self.game_over:
+            if self.state == GOAL:
+                status += " | Goal Reached!"
+            else:
+                status += " | Fell off cliff!"
+        self.status_text.set_text(status)
+    
+    def update_board(self):
+        """Update the path, position and status, blitting them over the cached scene"""
+        self.draw_environment_3d()
+        self.blitter.update()
     
     def on_key_press(self, event):
         """Handle keyboard input"""
@@ -129,12 +151,19 @@ class CliffWalking3DGame:
         elif event.key == 'r':
             self.reset_game()
     
-    def take_action(self, action):
-        """Take an action and update the game state"""
+    def record_state(self):
+        """Append the current state to the path buffer, doubling the buffer when it is full"""
+        if self.path_length == len(self.path):
+            self.path = np.concatenate([self.path, np.empty_like(self.path)])
+        self.path[self.path_length] = (self.state[1], self.state[0], PATH_BASE + PATH_RISE * self.path_length)
+        self.path_length += 1
+    
+    def take_action(self, action, redraw=True):
+        """Take an action and update the game state, redraw=False leaves the display for a later update"""
         next_state, reward = step(self.state, action)
         
         self.state = next_state
-        self.path.append(self.state.copy())
+        self.record_state()
         self.total_reward += reward
         self.steps += 1
         
@@ -146,18 +175,18 @@ class CliffWalking3DGame:
             self.game_over = True
             print(f"Fell off cliff! Total steps: {self.steps}, Total reward: {self.total_reward}")
         
-        self.draw_environment_3d()
-        plt.draw()
+        if redraw:
+            self.update_board()
     
     def reset_game(self, event=None):
         """Reset the game"""
         self.state = START.copy()
-        self.path = [START.copy()]
+        self.path_length = 0
+        self.record_state()
         self.total_reward = 0
         self.steps = 0
         self.game_over = False
-        self.draw_environment_3d()
-        plt.draw()
+        self.update_board()
         print("Game reset!")
     
     def toggle_auto(self, event=None):
@@ -165,19 +194,23 @@ class CliffWalking3DGame:
         self.auto_mode = not self.auto_mode
         if self.auto_mode:
             print("Auto-play enabled. Press 'r' to reset.")
-            self.auto_play()
+            self.auto_timer.start()
         else:
+            self.auto_timer.stop()
             print("Auto-play disabled.")
     
     def auto_play(self):
-        """Auto-play using random actions"""
-        import time
-        while self.auto_mode and not self.game_over:
-            action = np.random.choice(ACTIONS)
-            self.take_action(action)
-            plt.pause(0.3)
+        """Take auto_frame_stride random actions and draw once, auto-play stops once the episode is over"""
+        # Simulate several moves per frame, drawing is far slower than stepping the environment,
+        # and draw their random actions in one batch
+        for action in self.rng.choice(ACTIONS, size=self.auto_frame_stride):
             if self.game_over:
-                self.auto_mode = False
+                break
+            self.take_action(action, redraw=False)
+        self.update_board()
+        if self.game_over:
+            self.auto_mode = False
+            self.auto_timer.stop()
     
     def run(self):
         """Run the game"""
@@ -3,9 +3,16 @@
 Shows n-step TD trajectories and value functions in 3D
 """
 import numpy as np
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from plot_utils import FIGURE_DPI, show_or_close
+
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
-import os
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
 
 # Setup image directory path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -25,14 +32,15 @@ class RandomWalk3D:
         
         n_iterations = len(value_history)
         
-        for idx, values in enumerate(value_history[::max(1, n_iterations//10)]):
-            X = self.states
-            Y = np.full_like(X, idx)
-            Z = values[1:-1]
-            
-            # Plot line for this iteration
-            ax.plot(X, Y, Z, alpha=0.7, linewidth=2, 
-                   color=plt.cm.viridis(idx / len(value_history)))
+        # One line per sampled iteration, all drawn by a single collection
+        values = np.asarray(value_history[::max(1, n_iterations//10)])[:, 1:-1]
+        iterations = np.arange(len(values))
+        lines = np.empty(values.shape + (3,))
+        lines[:, :, 0] = self.states
+        lines[:, :, 1] = iterations[:, None]
+        lines[:, :, 2] = values
+        ax.add_collection3d(Line3DCollection(lines, alpha=0.7, linewidth=2,
+                                             colors=plt.cm.viridis(iterations / n_iterations)))
         
         ax.set_xlabel('State', fontsize=12)
         ax.set_ylabel('Iteration', fontsize=12)
@@ -41,8 +49,8 @@ class RandomWalk3D:
         ax.view_init(elev=30, azim=45)
         
         plt.savefig(os.path.join(IMAGE_DIR, 'random_walk_3d_convergence.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        show_or_close(fig)
         
     def visualize_trajectory_3d(self, trajectories):
         """Visualize multiple random walk trajectories in 3D"""
@@ -64,8 +72,8 @@ class RandomWalk3D:
         ax.view_init(elev=30, azim=45)
         
         plt.savefig(os.path.join(IMAGE_DIR, 'random_walk_3d_trajectories.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        show_or_close(fig)
         
     def visualize_n_step_comparison_3d(self):
         """Visualize n-step TD methods comparison in 3D"""
@@ -73,22 +81,15 @@ class RandomWalk3D:
         ax = fig.add_subplot(111, projection='3d')
         
         # Different n values
-        n_values = [1, 2, 4, 8, 16]
+        n_values = np.array([1, 2, 4, 8, 16])
         alpha_values = np.linspace(0, 1, 20)
         
-        # Create sample error surface (would be computed from actual runs)
+        # Create sample error surface (would be computed from actual runs),
+        # a simplified error model broadcast over every (n, alpha) pair
+        errors = 0.3 + np.abs(alpha_values - 0.5)[None, :] * 0.4 + (1 / (n_values[:, None] + 1)) * 0.2
+        
         for n_idx, n in enumerate(n_values):
-            errors = []
-            for alpha in alpha_values:
-                # Simplified error model
-                error = 0.3 + abs(alpha - 0.5) * 0.4 + (1 / (n + 1)) * 0.2
-                errors.append(error)
-            
-            X = alpha_values
-            Y = np.full_like(X, n)
-            Z = errors
-            
-            ax.plot(X, Y, Z, linewidth=3, alpha=0.8,
+            ax.plot(alpha_values, np.full_like(alpha_values, n), errors[n_idx], linewidth=3, alpha=0.8,
                    label=f'n={n}', color=plt.cm.viridis(n_idx / len(n_values)))
         
         ax.set_xlabel('Alpha (Learning Rate)', fontsize=12)
@@ -99,8 +100,8 @@ class RandomWalk3D:
         ax.view_init(elev=30, azim=45)
         
         plt.savefig(os.path.join(IMAGE_DIR, 'random_walk_3d_nstep_comparison.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        show_or_close(fig)
 
 
 def main():
@@ -121,14 +122,12 @@ def main():
     
     # Generate sample trajectories
     print("\nGenerating sample trajectories...")
-    trajectories = []
-    for _ in range(10):
-        traj = [N_STATES // 2]  # Start in middle
-        for _ in range(100):
-            traj.append(max(0, min(N_STATES, traj[-1] + np.random.choice([-1, 1]))))
-            if traj[-1] == 0 or traj[-1] == N_STATES:
-                break
-        trajectories.append(traj)
+    # Draw every step at once, start in the middle and stop each walk at its first boundary hit
+    steps = np.random.choice([-1, 1], size=(10, 100))
+    walks = N_STATES // 2 + np.cumsum(steps, axis=1)
+    hit = (walks <= 0) | (walks >= N_STATES)
+    ends = np.where(hit.any(axis=1), hit.argmax(axis=1) + 1, walks.shape[1])
+    trajectories = [[N_STATES // 2] + walk[:end].tolist() for walk, end in zip(walks, ends)]
     
     rw3d.visualize_trajectory_3d(trajectories)
     
@@ -3,62 +3,122 @@
 Shows maze structure and agent exploration in 3D
 """
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection
 import os
 import sys
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from plot_utils import FIGURE_DPI, FLOOR_LUT, bar_faces, floor_faces, reuse_figure, shared_figure, show_or_close
+
+import matplotlib.pyplot as plt
+from mpl_toolkits.mplot3d import Axes3D
+from mpl_toolkits.mplot3d.art3d import Line3DCollection, Poly3DCollection
+from numba import njit
+
 from chapter08.maze import Maze
 
 # Setup image directory path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGE_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'images')
 
+
+@njit(cache=True)
+def _simulate_path(q_value, start_i, start_j, obstacle_mask, goal_mask, epsilon, seed, path):
+    """Run one epsilon-greedy episode of Maze.step for at most len(path) - 1 steps
+    Writes the visited (row, column) states into path, returns how many were written and the total reward
+    """
+    np.random.seed(seed)
+    height, width, n_actions = q_value.shape
+    i, j = start_i, start_j
+    path[0, 0] = i
+    path[0, 1] = j
+    length = 1
+    total_reward = 0.0
+    
+    while length < path.shape[0] and not goal_mask[i, j]:
+        # Choose action
+        if np.random.random() < epsilon:
+            action = np.random.randint(0, n_actions)
+        else:
+            # Greedy action, ties broken uniformly at random by reservoir sampling
+            action = 0
+            n_best = 1
+            for a in range(1, n_actions):
+                if q_value[i, j, a] > q_value[i, j, action]:
+                    action = a
+                    n_best = 1
+                elif q_value[i, j, a] == q_value[i, j, action]:
+                    n_best += 1
+                    if np.random.randint(0, n_best) == 0:
+                        action = a
+        
+        # Take step, moves into an obstacle leave the agent in place
+        next_i, next_j = i, j
+        if action == 0:
+            next_i = max(i - 1, 0)
+        elif action == 1:
+            next_i = min(i + 1, height - 1)
+        elif action == 2:
+            next_j = max(j - 1, 0)
+        else:
+            next_j = min(j + 1, width - 1)
+        if not obstacle_mask[next_i, next_j]:
+            i, j = next_i, next_j
+        if goal_mask[i, j]:
+            total_reward += 1.0
+        path[length, 0] = i
+        path[length, 1] = j
+        length += 1
+    return length, total_reward
+
+
 class Maze3D:
     def __init__(self, maze=None):
         if maze is None:
             self.maze = Maze()
         else:
             self.maze = maze
-            
-    def visualize_maze_3d(self):
-        """Visualize the maze structure in 3D"""
-        fig = plt.figure(figsize=(16, 12))
-        ax = fig.add_subplot(111, projection='3d')
         
-        # Create grid
-        X, Y = np.meshgrid(range(self.maze.WORLD_WIDTH), range(self.maze.WORLD_HEIGHT))
-        Z = np.zeros_like(X)
-        
-        # Mark obstacles
-        obstacle_mask = np.zeros_like(Z, dtype=bool)
+        # Static scene data, computed once and shared by every figure and rollout
+        height, width = self.maze.WORLD_HEIGHT, self.maze.WORLD_WIDTH
+        self.X, self.Y = np.meshgrid(range(width), range(height))
+        self.obstacle_mask = np.zeros((height, width), dtype=bool)
         for obs in self.maze.obstacles:
-            obstacle_mask[obs[0], obs[1]] = True
+            self.obstacle_mask[obs[0], obs[1]] = True
+        self.goals = np.array(self.maze.GOAL_STATES, dtype=int).reshape(-1, 2)
+        self.goal_mask = np.zeros_like(self.obstacle_mask)
+        self.goal_mask[self.goals[:, 0], self.goals[:, 1]] = True
         
-        # Create surface with different colors
-        colors = np.ones_like(Z)
-        colors[obstacle_mask] = 0.3  # Darker for obstacles
+        # Floor cells, darker for obstacles
+        self.floor_cells = floor_faces(height, width)
+        self.floor_colors = FLOOR_LUT[self.obstacle_mask[:-1, :-1].astype(np.uint8)].reshape(-1, 4)
         
-        # Plot surface
-        ax.plot_surface(X, Y, Z, facecolors=plt.cm.RdYlGn(colors), 
-                       alpha=0.7, linewidth=0.5, antialiased=True)
+        # Obstacles as 3D bars
+        obstacles = np.array(self.maze.obstacles, dtype=float).reshape(-1, 2)
+        self.obstacle_faces = bar_faces(obstacles[:, 1], obstacles[:, 0], 0, 0.8, 0.8, 1.0)
+            
+    def visualize_maze_3d(self, fig=None):
+        """Visualize the maze structure in 3D, drawing on fig if given"""
+        owns_fig = fig is None
+        fig = reuse_figure(fig, (16, 12))
+        ax = fig.add_subplot(111, projection='3d')
         
-        # Draw obstacles as 3D bars
-        for obs in self.maze.obstacles:
-            ax.bar3d(obs[1], obs[0], 0, 0.8, 0.8, 1.0, 
-                    color='red', alpha=0.8, label='Obstacle' if obs == self.maze.obstacles[0] else '')
+        # Plot the flat floor as one collection of cells
+        ax.add_collection3d(Poly3DCollection(self.floor_cells, facecolors=self.floor_colors,
+                                             alpha=0.7, linewidth=0, antialiased=False, shade=True))
+        
+        # Draw obstacles as 3D bars, all in a single collection
+        if len(self.obstacle_faces):
+            ax.add_collection3d(Poly3DCollection(self.obstacle_faces, facecolors='red', alpha=0.8, shade=True,
+                                                 label='Obstacle'))
         
         # Mark start position
         ax.scatter([self.maze.START_STATE[1]], [self.maze.START_STATE[0]], [0.1], 
                   c='green', s=500, marker='o', label='Start', zorder=10)
         
         # Mark goal positions
-        for goal in self.maze.GOAL_STATES:
-            ax.scatter([goal[1]], [goal[0]], [0.1], 
-                      c='blue', s=500, marker='*', label='Goal' if goal == self.maze.GOAL_STATES[0] else '', zorder=10)
+        ax.scatter(self.goals[:, 1], self.goals[:, 0], np.full(len(self.goals), 0.1), 
+                  c='blue', s=500, marker='*', label='Goal', zorder=10)
         
         ax.set_xlabel('Column', fontsize=12)
         ax.set_ylabel('Row', fontsize=12)
@@ -70,68 +130,47 @@ class Maze3D:
         ax.legend()
         ax.view_init(elev=60, azim=45)
         
-        plt.savefig(os.path.join(IMAGE_DIR, 'maze_3d_structure.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+        fig.savefig(os.path.join(IMAGE_DIR, 'maze_3d_structure.png'), 
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        if owns_fig:
+            show_or_close(fig)
         
     def simulate_path(self, q_value, epsilon=0.1, max_steps=1000):
         """Simulate a path through the maze"""
-        state = self.maze.START_STATE.copy()
-        path = [state.copy()]
-        total_reward = 0
-        
-        for step in range(max_steps):
-            if state in self.maze.GOAL_STATES:
-                break
-                
-            # Choose action
-            if np.random.rand() < epsilon:
-                action = np.random.choice(self.maze.actions)
-            else:
-                values = q_value[state[0], state[1], :]
-                action = np.random.choice([a for a, v in enumerate(values) if v == np.max(values)])
-            
-            # Take step
-            next_state, reward = self.maze.step(state, action)
-            path.append(next_state.copy())
-            total_reward += reward
-            state = next_state
-            
-        return path, total_reward
+        path = np.empty((max_steps + 1, 2), dtype=np.int64)
+        # Seed the compiled rollout from the global generator so np.random.seed still applies
+        length, total_reward = _simulate_path(np.asarray(q_value, dtype=np.float64),
+                                              self.maze.START_STATE[0], self.maze.START_STATE[1],
+                                              self.obstacle_mask, self.goal_mask, epsilon, np.random.randint(2 ** 31), path)
+        return path[:length].tolist(), total_reward
         
-    def visualize_path_3d(self, path, title="Agent Path"):
-        """Visualize agent's path in 3D"""
-        fig = plt.figure(figsize=(16, 12))
+    def visualize_path_3d(self, path, title="Agent Path", fig=None):
+        """Visualize agent's path in 3D, drawing on fig if given"""
+        owns_fig = fig is None
+        fig = reuse_figure(fig, (16, 12))
         ax = fig.add_subplot(111, projection='3d')
         
         # Create maze surface
-        X, Y = np.meshgrid(range(self.maze.WORLD_WIDTH), range(self.maze.WORLD_HEIGHT))
-        Z = np.zeros_like(X)
-        
-        obstacle_mask = np.zeros_like(Z, dtype=bool)
-        for obs in self.maze.obstacles:
-            obstacle_mask[obs[0], obs[1]] = True
-        
-        colors = np.ones_like(Z)
-        colors[obstacle_mask] = 0.3
-        
-        ax.plot_surface(X, Y, Z, facecolors=plt.cm.RdYlGn(colors), 
-                       alpha=0.5, linewidth=0.5, antialiased=True)
+        ax.add_collection3d(Poly3DCollection(self.floor_cells, facecolors=self.floor_colors,
+                                             alpha=0.5, linewidth=0, antialiased=False, shade=True))
         
         # Draw obstacles
-        for obs in self.maze.obstacles:
-            ax.bar3d(obs[1], obs[0], 0, 0.8, 0.8, 1.0, color='red', alpha=0.6)
+        if len(self.obstacle_faces):
+            ax.add_collection3d(Poly3DCollection(self.obstacle_faces, facecolors='red', alpha=0.6, shade=True))
         
         # Extract path coordinates
         if path:
-            path_x = [p[1] for p in path]
-            path_y = [p[0] for p in path]
-            path_z = [0.1 + i * 0.02 for i in range(len(path))]
+            points = np.asarray(path)
+            steps = np.arange(len(points))
+            path_x = points[:, 1]
+            path_y = points[:, 0]
+            path_z = 0.1 + steps * 0.02
             
-            # Plot path
-            ax.plot(path_x, path_y, path_z, 'b-', linewidth=3, label='Agent Path', zorder=5)
-            ax.scatter(path_x, path_y, path_z, c=range(len(path)), 
-                      cmap='cool', s=100, alpha=0.8, zorder=6)
+            # Plot path as one segment per step, colored by when it was taken
+            if len(points) > 1:
+                xyz = np.column_stack([path_x, path_y, path_z])
+                ax.add_collection3d(Line3DCollection(np.stack([xyz[:-1], xyz[1:]], axis=1), array=steps[:-1],
+                                                     cmap='cool', linewidth=3, label='Agent Path', zorder=5))
             
             # Mark start and end
             ax.scatter([path_x[0]], [path_y[0]], [path_z[0]], 
@@ -146,13 +185,15 @@ class Maze3D:
         ax.legend()
         ax.view_init(elev=60, azim=45)
         
-        plt.savefig(os.path.join(IMAGE_DIR, f'maze_3d_{title.lower().replace(" ", "_")}.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+        fig.savefig(os.path.join(IMAGE_DIR, f'maze_3d_{title.lower().replace(" ", "_")}.png'), 
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        if owns_fig:
+            show_or_close(fig)
         
-    def visualize_q_values_3d(self, q_value):
-        """Visualize Q-values as 3D surfaces for each action"""
-        fig = plt.figure(figsize=(18, 12))
+    def visualize_q_values_3d(self, q_value, fig=None):
+        """Visualize Q-values as 3D surfaces for each action, drawing on fig if given"""
+        owns_fig = fig is None
+        fig = reuse_figure(fig, (18, 12))
         
         action_names = ['Up', 'Down', 'Left', 'Right']
         
@@ -162,12 +203,8 @@ class Maze3D:
             # Extract Q-values for this action
             Q_action = q_value[:, :, action_idx]
             
-            # Create meshgrid
-            X, Y = np.meshgrid(range(self.maze.WORLD_WIDTH), range(self.maze.WORLD_HEIGHT))
-            Z = Q_action
-            
             # Plot surface
-            surf = ax.plot_surface(X, Y, Z, cmap='viridis', alpha=0.8, 
+            surf = ax.plot_surface(self.X, self.Y, Q_action, cmap='viridis', alpha=0.8, 
                                  linewidth=0.5, antialiased=True, edgecolor='black')
             
             # Mark special positions
@@ -175,10 +212,9 @@ class Maze3D:
                       [Q_action[self.maze.START_STATE[0], self.maze.START_STATE[1]]], 
                       c='green', s=200, marker='o', zorder=10)
             
-            for goal in self.maze.GOAL_STATES:
-                ax.scatter([goal[1]], [goal[0]], 
-                          [Q_action[goal[0], goal[1]]], 
-                          c='red', s=200, marker='*', zorder=10)
+            ax.scatter(self.goals[:, 1], self.goals[:, 0], 
+                      Q_action[self.goals[:, 0], self.goals[:, 1]], 
+                      c='red', s=200, marker='*', zorder=10)
             
             ax.set_xlabel('Column', fontsize=10)
             ax.set_ylabel('Row', fontsize=10)
@@ -186,20 +222,23 @@ class Maze3D:
             ax.set_title(f'Q-Values for Action: {action_name}', fontsize=12, fontweight='bold')
             ax.view_init(elev=45, azim=45)
             
-            plt.colorbar(surf, ax=ax, shrink=0.6, aspect=20)
+            fig.colorbar(surf, ax=ax, shrink=0.6, aspect=20)
         
-        plt.tight_layout()
-        plt.savefig(os.path.join(IMAGE_DIR, 'maze_3d_q_values.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+        fig.tight_layout()
+        fig.savefig(os.path.join(IMAGE_DIR, 'maze_3d_q_values.png'), 
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        if owns_fig:
+            show_or_close(fig)
 
 
 def main():
     """Main function to demonstrate 3D visualizations"""
     maze_3d = Maze3D()
+    # Nothing is shown when headless, so draw every figure on one reused canvas
+    fig = shared_figure()
     
     print("Visualizing maze structure...")
-    maze_3d.visualize_maze_3d()
+    maze_3d.visualize_maze_3d(fig=fig)
     
     # Create sample Q-values
     print("\nCreating sample Q-values...")
@@ -212,7 +251,7 @@ def main():
         q_value[goal[0], goal[1], :] = 10
     
     print("\nVisualizing Q-values...")
-    maze_3d.visualize_q_values_3d(q_value)
+    maze_3d.visualize_q_values_3d(q_value, fig=fig)
     
     # Simulate a path
     print("\nSimulating path...")
@@ -220,7 +259,10 @@ def main():
     print(f"Path completed with {len(path)} steps, total reward: {reward}")
     
     print("\nVisualizing path...")
-    maze_3d.visualize_path_3d(path, "Sample Agent Path")
+    maze_3d.visualize_path_3d(path, "Sample Agent Path", fig=fig)
+    
+    if fig is not None:
+        plt.close(fig)
 
 
 if __name__ == '__main__':
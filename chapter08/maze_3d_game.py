@@ -5,6 +5,7 @@ Navigate through the maze using arrow keys
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
+from mpl_toolkits.mplot3d.art3d import Line3DCollection, Poly3DCollection
 from matplotlib.widgets import Button
 import os
 import sys
@@ -12,31 +13,55 @@ import sys
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from chapter08.maze import Maze
+from plot_utils import FLOOR_LUT, BlitManager, bar_faces, floor_faces
 
 # Setup image directory path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGE_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'images')
 
+# Initial length of the path buffer, it doubles whenever a long episode fills it
+PATH_CAPACITY = 256
+# Height of the path above the floor at its start, and how much it rises per move
+PATH_BASE = 0.1
+PATH_RISE = 0.02
+
 class Maze3DGame:
-    def __init__(self, maze=None):
+    def __init__(self, maze=None, auto_frame_stride=10):
         if maze is None:
             self.maze = Maze()
         else:
             self.maze = maze
             
+        # Goal cells as a set of tuples, so the per-move goal test is one hash lookup
+        self.goal_states = {tuple(goal) for goal in self.maze.GOAL_STATES}
+        
         self.fig = plt.figure(figsize=(16, 12))
         self.ax = self.fig.add_subplot(111, projection='3d')
         
         self.state = self.maze.START_STATE.copy()
-        self.path = [self.state.copy()]
+        # Visited states as the (column, row, height) points they are drawn at,
+        # preallocated so a move only writes one row
+        self.path = np.empty((PATH_CAPACITY, 3))
+        self.path_length = 0
+        self.record_state()
         self.total_reward = 0
         self.steps = 0
         self.game_over = False
         self.auto_mode = False
+        # Auto-play moves simulated per drawn frame
+        self.auto_frame_stride = auto_frame_stride
+        self.rng = np.random.default_rng()
+        
+        self.setup_environment_3d()
+        self.blitter = BlitManager(self.ax, [self.path_segments, self.current_marker, self.status_text])
         
         # Connect keyboard events
         self.fig.canvas.mpl_connect('key_press_event', self.on_key_press)
         
+        # Drive auto-play from the GUI event loop, auto_frame_stride moves and one draw per tick, instead of sleeping between moves
+        self.auto_timer = self.fig.canvas.new_timer(interval=200)
+        self.auto_timer.add_callback(self.auto_play)
+        
         # Create control buttons
         ax_reset = plt.axes([0.7, 0.05, 0.1, 0.04])
         self.btn_reset = Button(ax_reset, 'Reset')
@@ -46,68 +71,42 @@ class Maze3DGame:
         self.btn_auto = Button(ax_auto, 'Auto Play')
         self.btn_auto.on_clicked(self.toggle_auto)
         
-    def draw_environment_3d(self):
-        """Draw the 3D maze environment"""
-        self.ax.clear()
-        
-        # Create grid
-        X, Y = np.meshgrid(range(self.maze.WORLD_WIDTH), range(self.maze.WORLD_HEIGHT))
-        Z = np.zeros_like(X)
-        
+    def setup_environment_3d(self):
+        """Draw the static 3D maze environment and create the persistent game artists"""
         # Mark obstacles
-        obstacle_mask = np.zeros_like(Z, dtype=bool)
+        obstacle_mask = np.zeros((self.maze.WORLD_HEIGHT, self.maze.WORLD_WIDTH), dtype=bool)
         for obs in self.maze.obstacles:
             obstacle_mask[obs[0], obs[1]] = True
         
-        # Create surface with different colors
-        colors = np.ones_like(Z)
-        colors[obstacle_mask] = 0.3
+        # Plot the flat floor as one collection of cells, darker under obstacles
+        cell_colors = FLOOR_LUT[obstacle_mask[:-1, :-1].astype(np.uint8)].reshape(-1, 4)
+        self.ax.add_collection3d(Poly3DCollection(floor_faces(*obstacle_mask.shape), facecolors=cell_colors,
+                                                  alpha=0.7, linewidth=0, antialiased=False, shade=True))
         
-        # Plot surface
-        self.ax.plot_surface(X, Y, Z, facecolors=plt.cm.RdYlGn(colors), 
-                       alpha=0.7, linewidth=0.5, antialiased=True)
-        
-        # Draw obstacles as 3D bars
-        for obs in self.maze.obstacles:
-            self.ax.bar3d(obs[1], obs[0], 0, 0.8, 0.8, 1.0, 
-                    color='red', alpha=0.8)
+        # Draw obstacles as 3D bars, all in a single collection
+        obstacles = np.array(self.maze.obstacles, dtype=float).reshape(-1, 2)
+        if len(obstacles):
+            self.ax.add_collection3d(Poly3DCollection(bar_faces(obstacles[:, 1], obstacles[:, 0], 0, 0.8, 0.8, 1.0),
+                                                      facecolors='red', alpha=0.8, shade=True))
         
         # Mark start position
         self.ax.scatter([self.maze.START_STATE[1]], [self.maze.START_STATE[0]], [0.1], 
                   c='green', s=500, marker='o', label='Start', zorder=10)
         
         # Mark goal positions
-        for goal in self.maze.GOAL_STATES:
-            self.ax.scatter([goal[1]], [goal[0]], [0.1], 
-                      c='blue', s=500, marker='*', label='Goal' if goal == self.maze.GOAL_STATES[0] else '', zorder=10)
-        
-        # Draw path
-        if len(self.path) > 1:
-            path_x = [p[1] for p in self.path]
-            path_y = [p[0] for p in self.path]
-            path_z = [0.1 + i * 0.02 for i in range(len(self.path))]
-            
-            self.ax.plot(path_x, path_y, path_z, 'b-', linewidth=3, label='Path', zorder=5)
-            self.ax.scatter(path_x, path_y, path_z, c=range(len(self.path)), 
-                      cmap='cool', s=100, alpha=0.8, zorder=6)
-        
-        # Mark current position
-        self.ax.scatter([self.state[1]], [self.state[0]], [0.2], 
+        goals = np.array(self.maze.GOAL_STATES).reshape(-1, 2)
+        self.ax.scatter(goals[:, 1], goals[:, 0], np.full(len(goals), 0.1), 
+                  c='blue', s=500, marker='*', label='Goal', zorder=10)
+        
+        # Path, current position and status are animated so moves can be blitted over the cached scene
+        self.path_segments = Line3DCollection([], cmap='cool', linewidth=3, label='Path', zorder=5, animated=True)
+        self.ax.add_collection3d(self.path_segments, autolim=False)
+        self.current_marker = self.ax.scatter([self.state[1]], [self.state[0]], [0.2], 
                   c='yellow', s=600, marker='D', label='Current', zorder=10, 
-                  edgecolors='black', linewidths=2)
-        
-        # Add status text
-        status = (f"Steps: {self.steps} | Reward: {self.total_reward} | "
-                 f"Position: ({self.state[0]}, {self.state[1]})")
-        if self.game_over:
-            if self.state in self.maze.GOAL_STATES:
-                status += " | Goal Reached!"
-            else:
-                status += " | Game Over"
-        
-        self.ax.text2D(0.05, 0.95, status, transform=self.ax.transAxes, 
-                       fontsize=12, verticalalignment='top',
-                       bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.8))
+                  edgecolors='black', linewidths=2, animated=True)
+        self.status_text = self.ax.text2D(0.05, 0.95, '', transform=self.ax.transAxes, 
+                                          fontsize=12, verticalalignment='top', animated=True,
+                                          bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.8))
         
         self.ax.set_xlabel('Column', fontsize=12)
         self.ax.set_ylabel('Row', fontsize=12)
@@ -119,7 +118,33 @@ class Maze3DGame:
         self.ax.legend(loc='upper right')
         self.ax.view_init(elev=60, azim=45)
         
-        plt.tight_layout()
+    def draw_environment_3d(self):
+        """Update the path, current position and status text to the game state"""
+        # Draw path as one segment per move, colored by when it was taken
+        points = self.path[:self.path_length]
+        self.path_segments.set_segments(np.stack([points[:-1], points[1:]], axis=1))
+        # Heights grow linearly with the step, so they order the colors directly
+        self.path_segments.set_array(points[:-1, 2])
+        self.path_segments.set_clim(PATH_BASE, PATH_BASE + PATH_RISE * max(len(points) - 2, 1))
+        
+        # Mark current position
+        self.current_marker.set_offsets([[self.state[1], self.state[0]]])
+        self.current_marker.set_3d_properties([0.2], 'z')
+        
+        # Add status text
+        status = (f"Steps: {self.steps} | Reward: {self.total_reward} | "
+                 f"Position: ({self.state[0]}, {self.state[1]})")
+        if self.game_over:
+            if tuple(self.state) in self.goal_states:
+                status += " | Goal Reached!"
+            else:
+                status += " | Game Over"
+        self.status_text.set_text(status)
+        
+    def update_board(self):
+        """Update the path, position and status, blitting them over the cached scene"""
+        self.draw_environment_3d()
+        self.blitter.update()
     
     def on_key_press(self, event):
         """Handle keyboard input"""
@@ -138,32 +163,39 @@ class Maze3DGame:
         elif event.key == 'r':
             self.reset_game()
     
-    def take_action(self, action):
-        """Take an action and update the game state"""
+    def record_state(self):
+        """Append the current state to the path buffer, doubling the buffer when it is full"""
+        if self.path_length == len(self.path):
+            self.path = np.concatenate([self.path, np.empty_like(self.path)])
+        self.path[self.path_length] = (self.state[1], self.state[0], PATH_BASE + PATH_RISE * self.path_length)
+        self.path_length += 1
+    
+    def take_action(self, action, redraw=True):
+        """Take an action and update the game state, redraw=False leaves the display for a later update"""
         next_state, reward = self.maze.step(self.state, action)
         
         self.state = next_state
-        self.path.append(self.state.copy())
+        self.record_state()
         self.total_reward += reward
         self.steps += 1
         
         # Check if game is over
-        if self.state in self.maze.GOAL_STATES:
+        if tuple(self.state) in self.goal_states:
             self.game_over = True
             print(f"Goal reached! Total steps: {self.steps}, Total reward: {self.total_reward}")
         
-        self.draw_environment_3d()
-        plt.draw()
+        if redraw:
+            self.update_board()
     
     def reset_game(self, event=None):
         """Reset the game"""
         self.state = self.maze.START_STATE.copy()
-        self.path = [self.state.copy()]
+        self.path_length = 0
+        self.record_state()
         self.total_reward = 0
         self.steps = 0
         self.game_over = False
-        self.draw_environment_3d()
-        plt.draw()
+        self.update_board()
         print("Game reset!")
     
     def toggle_auto(self, event=None):
@@ -171,19 +203,23 @@ class Maze3DGame:
         self.auto_mode = not self.auto_mode
         if self.auto_mode:
             print("Auto-play enabled. Press 'r' to reset.")
-            self.auto_play()
+            self.auto_timer.start()
         else:
+            self.auto_timer.stop()
             print("Auto-play disabled.")
     
     def auto_play(self):
-        """Auto-play using random actions"""
-        import time
-        while self.auto_mode and not self.game_over:
-            action = np.random.choice(self.maze.actions)
-            self.take_action(action)
-            plt.pause(0.2)
+        """Take auto_frame_stride random actions and draw once, auto-play stops once the episode is over"""
+        # Simulate several moves per frame, drawing is far slower than stepping the environment,
+        # and draw their random actions in one batch
+        for action in self.rng.choice(self.maze.actions, size=self.auto_frame_stride):
             if self.game_over:
-                self.auto_mode = False
+                break
+            self.take_action(action, redraw=False)
+        self.update_board()
+        if self.game_over:
+            self.auto_mode = False
+            self.auto_timer.stop()
     
     def run(self):
         """Run the game"""
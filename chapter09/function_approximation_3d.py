@@ -3,9 +3,15 @@
 Shows tile coding, fourier basis, and polynomial approximation surfaces
 """
 import numpy as np
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from plot_utils import FIGURE_DPI
+
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
-import os
 
 # Setup image directory path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -87,7 +93,7 @@ class FunctionApproximation3D:
         
         plt.tight_layout()
         plt.savefig(os.path.join(IMAGE_DIR, 'function_approximation_3d.png'), 
-                   dpi=150, bbox_inches='tight')
+                   dpi=FIGURE_DPI, bbox_inches='tight')
         plt.show()
 
 
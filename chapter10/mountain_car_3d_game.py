@@ -3,34 +3,76 @@
 Play the mountain car game in 3D with real-time visualization
 """
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-from matplotlib.animation import FuncAnimation
 import os
 import sys
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from chapter10.mountain_car import step, ACTIONS, POSITION_MIN, POSITION_MAX, VELOCITY_MIN, VELOCITY_MAX
+from plot_utils import FIGURE_DPI, show_or_close, surface_edges
+
+import matplotlib.pyplot as plt
+from mpl_toolkits.mplot3d import Axes3D
+from matplotlib.animation import FuncAnimation
+from numba import njit
+
+from chapter10.mountain_car import step, POSITION_MIN, POSITION_MAX, VELOCITY_MIN, VELOCITY_MAX
 
 # Setup image directory path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGE_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'images')
 
+# Mountain surface over the state space, shared by every visualization,
+# the smooth mountain shape needs no finer grid
+SURFACE_X, SURFACE_Y = np.meshgrid(np.linspace(POSITION_MIN, POSITION_MAX, 30),
+                                   np.linspace(VELOCITY_MIN, VELOCITY_MAX, 30))
+SURFACE_Z = np.sin(3 * SURFACE_X)
+GOAL_HEIGHT = np.sin(3 * POSITION_MAX)
+
+# The environment step, compiled so the rollout below can call it
+_step = njit(cache=True)(step)
+
+
+@njit(cache=True)
+def _random_rollout(position, velocity, seed, positions, velocities, rewards):
+    """Take uniformly random actions until the goal is reached or len(positions) steps are taken
+    Writes each new state and reward into the arrays, returns the number of steps taken
+    """
+    np.random.seed(seed)
+    n = 0
+    while n < positions.shape[0]:
+        # A uniformly random action from mountain_car.ACTIONS, the integers -1, 0 and 1
+        position, velocity, reward = _step(position, velocity, np.random.randint(0, 3) - 1)
+        positions[n] = position
+        velocities[n] = velocity
+        rewards[n] = reward
+        n += 1
+        if position >= POSITION_MAX:
+            break
+    return n
+
+
 class MountainCar3DGame:
     def __init__(self):
         self.position = -0.5
         self.velocity = 0.0
         self.steps = 0
         self.max_steps = 1000
-        self.history = []
+        # Episode history as one preallocated array per field, the first self.steps entries are filled
+        self.positions = np.empty(self.max_steps)
+        self.velocities = np.empty(self.max_steps)
+        self.rewards = np.empty(self.max_steps)
         
     def reset(self):
         """Reset the game"""
         self.position = np.random.uniform(-0.6, -0.4)
         self.velocity = 0.0
         self.steps = 0
-        self.history = []
+        
+    @property
+    def history(self):
+        """Episode history as (position, velocity, reward) rows"""
+        return np.column_stack([self.positions[:self.steps], self.velocities[:self.steps],
+                                self.rewards[:self.steps]])
         
     def get_state(self):
         """Get current state"""
@@ -39,8 +81,14 @@ class MountainCar3DGame:
     def take_action(self, action):
         """Take an action and return reward"""
         self.position, self.velocity, reward = step(self.position, self.velocity, action)
+        if self.steps == len(self.positions):
+            # Stepping on past max_steps, double the history arrays
+            self.positions, self.velocities, self.rewards = [
+                np.concatenate([a, np.empty_like(a)]) for a in (self.positions, self.velocities, self.rewards)]
+        self.positions[self.steps] = self.position
+        self.velocities[self.steps] = self.velocity
+        self.rewards[self.steps] = reward
         self.steps += 1
-        self.history.append((self.position, self.velocity, reward))
         return reward, self.is_done()
         
     def is_done(self):
@@ -52,25 +100,12 @@ class MountainCar3DGame:
         fig = plt.figure(figsize=(16, 12))
         ax = fig.add_subplot(111, projection='3d')
         
-        # Create mountain landscape
-        x = np.linspace(POSITION_MIN, POSITION_MAX, 100)
-        y = np.sin(3 * x)  # Mountain shape
-        
-        # Create 3D surface
-        X = np.linspace(POSITION_MIN, POSITION_MAX, 50)
-        Y = np.linspace(VELOCITY_MIN, VELOCITY_MAX, 50)
-        X, Y = np.meshgrid(X, Y)
-        Z = np.sin(3 * X)  # Mountain surface
-        
         # Plot mountain surface
-        surf = ax.plot_surface(X, Y, Z, cmap='terrain', alpha=0.7, 
-                               linewidth=0.5, antialiased=True)
+        surf = ax.plot_surface(SURFACE_X, SURFACE_Y, SURFACE_Z, cmap='terrain', alpha=0.7, rstride=1, cstride=1,
+                               antialiased=True, rasterized=True, **surface_edges(max(SURFACE_Z.shape)))
         
         # Mark goal position
-        goal_x = POSITION_MAX
-        goal_y = 0
-        goal_z = np.sin(3 * goal_x)
-        ax.scatter([goal_x], [goal_y], [goal_z], 
+        ax.scatter([POSITION_MAX], [0], [GOAL_HEIGHT], 
                   c='green', s=500, marker='*', label='Goal', zorder=10)
         
         # Mark start position
@@ -89,40 +124,37 @@ class MountainCar3DGame:
         
         plt.colorbar(surf, ax=ax, shrink=0.5, aspect=20)
         plt.savefig(os.path.join(IMAGE_DIR, 'mountain_car_3d_environment.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        show_or_close(fig)
         
     def visualize_trajectory_3d(self, trajectory=None):
-        """Visualize a trajectory in 3D"""
+        """Visualize a trajectory in 3D, the current episode history by default"""
         if trajectory is None:
-            trajectory = self.history
+            positions, velocities, rewards = (self.positions[:self.steps], self.velocities[:self.steps],
+                                              self.rewards[:self.steps])
+        else:
+            # Extract trajectory, one array per field
+            trajectory = np.asarray(trajectory, dtype=float).reshape(-1, 3)
+            positions, velocities, rewards = trajectory[:, 0], trajectory[:, 1], trajectory[:, 2]
             
-        if not trajectory:
+        if not len(positions):
             print("No trajectory to visualize")
             return
             
         fig = plt.figure(figsize=(16, 12))
         ax = fig.add_subplot(111, projection='3d')
         
-        # Create mountain surface
-        X = np.linspace(POSITION_MIN, POSITION_MAX, 50)
-        Y = np.linspace(VELOCITY_MIN, VELOCITY_MAX, 50)
-        X, Y = np.meshgrid(X, Y)
-        Z = np.sin(3 * X)
-        
-        ax.plot_surface(X, Y, Z, cmap='terrain', alpha=0.5, 
-                       linewidth=0.5, antialiased=True)
+        # Plot mountain surface
+        ax.plot_surface(SURFACE_X, SURFACE_Y, SURFACE_Z, cmap='terrain', alpha=0.5, rstride=1, cstride=1,
+                       antialiased=True, rasterized=True, **surface_edges(max(SURFACE_Z.shape)))
         
-        # Extract trajectory
-        positions = [t[0] for t in trajectory]
-        velocities = [t[1] for t in trajectory]
-        heights = [np.sin(3 * p) for p in positions]
-        rewards = [t[2] for t in trajectory]
+        # Look up all heights in one call
+        heights = np.sin(3 * positions)
         
         # Plot trajectory
         ax.plot(positions, velocities, heights, 'b-', linewidth=3, label='Trajectory', zorder=5)
         scatter = ax.scatter(positions, velocities, heights, 
-                           c=range(len(trajectory)), cmap='cool', 
+                           c=np.arange(len(positions)), cmap='cool', 
                            s=100, alpha=0.8, zorder=6)
         
         # Mark start and end
@@ -140,30 +172,25 @@ class MountainCar3DGame:
         
         plt.colorbar(scatter, ax=ax, shrink=0.5, aspect=20)
         plt.savefig(os.path.join(IMAGE_DIR, 'mountain_car_3d_trajectory.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        show_or_close(fig)
         
     def visualize_value_function_3d(self, value_func):
         """Visualize value function as 3D surface"""
         fig = plt.figure(figsize=(16, 12))
         ax = fig.add_subplot(111, projection='3d')
         
-        # Create grid
-        positions = np.linspace(POSITION_MIN, POSITION_MAX, 50)
-        velocities = np.linspace(VELOCITY_MIN, VELOCITY_MAX, 50)
-        P, V = np.meshgrid(positions, velocities)
+        # Evaluate on the shared state space grid
+        P, V = SURFACE_X, SURFACE_Y
         
         # Compute values (simplified - would need actual value function)
-        # For demonstration, create a sample value function
-        Z = np.zeros_like(P)
-        for i in range(len(positions)):
-            for j in range(len(velocities)):
-                # Sample value function (would be replaced with actual)
-                Z[j, i] = -np.abs(positions[i] - POSITION_MAX) * 10
+        # For demonstration, create a sample value function over the whole grid at once
+        # (would be replaced with actual)
+        Z = -np.abs(P - POSITION_MAX) * 10
         
         # Plot surface
-        surf = ax.plot_surface(P, V, Z, cmap='viridis', alpha=0.8, 
-                               linewidth=0.5, antialiased=True)
+        surf = ax.plot_surface(P, V, Z, cmap='viridis', alpha=0.8, rstride=1, cstride=1,
+                               antialiased=True, rasterized=True, **surface_edges(max(Z.shape)))
         
         ax.set_xlabel('Position', fontsize=12)
         ax.set_ylabel('Velocity', fontsize=12)
@@ -173,17 +200,19 @@ class MountainCar3DGame:
         
         plt.colorbar(surf, ax=ax, shrink=0.5, aspect=20)
         plt.savefig(os.path.join(IMAGE_DIR, 'mountain_car_3d_value.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+                   dpi=FIGURE_DPI, bbox_inches='tight')
+        show_or_close(fig)
         
     def play_random_episode(self):
         """Play a random episode"""
         self.reset()
-        while not self.is_done():
-            action = np.random.choice(ACTIONS)
-            reward, done = self.take_action(action)
-            if done:
-                break
+        # Play the whole episode in the compiled rollout, seeded from the global generator
+        # so np.random.seed still applies
+        self.steps = _random_rollout(self.position, self.velocity, np.random.randint(2 ** 31),
+                                     self.positions[:self.max_steps], self.velocities[:self.max_steps],
+                                     self.rewards[:self.max_steps])
+        self.position = self.positions[self.steps - 1]
+        self.velocity = self.velocities[self.steps - 1]
         return self.history
 
 
@@ -6,18 +6,35 @@ import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 from matplotlib.widgets import Button
-from matplotlib.animation import FuncAnimation
 import os
 import sys
+import time
+from functools import partial
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from chapter10.mountain_car import step, ACTIONS, POSITION_MIN, POSITION_MAX, VELOCITY_MIN, VELOCITY_MAX
+from plot_utils import BlitManager, env_flag, surface_edges
 
 # Setup image directory path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGE_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'images')
 
+# Mountain surface over the state space, computed once at import
+SURFACE_X, SURFACE_Y = np.meshgrid(np.linspace(POSITION_MIN, POSITION_MAX, 50),
+                                   np.linspace(VELOCITY_MIN, VELOCITY_MAX, 50))
+SURFACE_Z = np.sin(3 * SURFACE_X)
+GOAL_HEIGHT = np.sin(3 * POSITION_MAX)
+
+# Number of recent states drawn as the trail behind the car
+TRAIL_LENGTH = 100
+
+# The game is drawn at ~30 frames per second while the car moves at a fixed 20 steps per second,
+# with at most MAX_STEPS_PER_FRAME steps taken to catch up after a slow frame
+FRAME_INTERVAL = 33  # ms
+STEP_INTERVAL = 0.05  # seconds
+MAX_STEPS_PER_FRAME = 10
+
 class MountainCar3DInteractive:
     def __init__(self):
         self.fig = plt.figure(figsize=(16, 12))
@@ -27,10 +44,20 @@ class MountainCar3DInteractive:
         self.velocity = 0.0
         self.steps = 0
         self.max_steps = 1000
-        self.trajectory = [(self.position, self.velocity)]
+        # Visited states as one preallocated array per field, an episode visits at most max_steps + 1,
+        # the first self.steps + 1 entries are filled
+        self.positions = np.empty(self.max_steps + 1)
+        self.velocities = np.empty(self.max_steps + 1)
+        self.record_state()
         self.game_over = False
         self.auto_mode = False
         self.current_action = ACTIONS[1]  # Start with no action
+        # Wall time not yet turned into steps, and when it was last updated
+        self.step_clock = 0.0
+        self.last_frame_time = time.perf_counter()
+        
+        self.setup_environment_3d()
+        self.blitter = BlitManager(self.ax, [self.traj_line, self.car_marker, self.status_text, self.action_text])
         
         # Connect keyboard events
         self.fig.canvas.mpl_connect('key_press_event', self.on_key_press)
@@ -45,52 +72,49 @@ class MountainCar3DInteractive:
         self.btn_auto = Button(ax_auto, 'Auto Play')
         self.btn_auto.on_clicked(self.toggle_auto)
         
-        # Animation
-        self.animation = None
-        
-    def draw_environment_3d(self):
-        """Draw the 3D mountain car environment"""
-        self.ax.clear()
-        
-        # Create mountain landscape
-        x = np.linspace(POSITION_MIN, POSITION_MAX, 100)
-        y_mountain = np.sin(3 * x)
-        
-        # Create 3D surface
-        X = np.linspace(POSITION_MIN, POSITION_MAX, 50)
-        Y = np.linspace(VELOCITY_MIN, VELOCITY_MAX, 50)
-        X, Y = np.meshgrid(X, Y)
-        Z = np.sin(3 * X)  # Mountain surface
+        # Animation timer, each tick draws one frame after taking the 0 to MAX_STEPS_PER_FRAME steps due by wall-clock time
+        self.timer = None
         
+    def setup_environment_3d(self):
+        """Draw the static 3D mountain car environment and create the persistent game artists"""
         # Plot mountain surface
-        self.ax.plot_surface(X, Y, Z, cmap='terrain', alpha=0.6, 
-                             linewidth=0.5, antialiased=True)
+        self.ax.plot_surface(SURFACE_X, SURFACE_Y, SURFACE_Z, cmap='terrain', alpha=0.6, rstride=1, cstride=1,
+                             antialiased=True, **surface_edges(max(SURFACE_Z.shape)))
         
         # Mark goal position
-        goal_x = POSITION_MAX
-        goal_y = 0
-        goal_z = np.sin(3 * goal_x)
-        self.ax.scatter([goal_x], [goal_y], [goal_z], 
+        self.ax.scatter([POSITION_MAX], [0], [GOAL_HEIGHT], 
                   c='green', s=500, marker='*', label='Goal', zorder=10)
         
-        # Draw trajectory
-        if len(self.trajectory) > 1:
-            traj_x = [t[0] for t in self.trajectory]
-            traj_y = [t[1] for t in self.trajectory]
-            traj_z = [np.sin(3 * x) for x in traj_x]
-            
-            self.ax.plot(traj_x, traj_y, traj_z, 'b-', linewidth=2, 
-                        label='Trajectory', zorder=5, alpha=0.7)
-        
-        # Mark current car position
-        car_x = self.position
-        car_y = self.velocity
-        car_z = np.sin(3 * car_x)
-        self.ax.scatter([car_x], [car_y], [car_z], 
+        # Trajectory, car and status are animated so frames can be blitted over the cached scene
+        self.traj_line, = self.ax.plot([], [], [], 'b-', linewidth=2, 
+                                       label='Trajectory', zorder=5, alpha=0.7, animated=True)
+        self.car_marker = self.ax.scatter([self.position], [self.velocity], [np.sin(3 * self.position)], 
                   c='red', s=600, marker='o', label='Car', zorder=10, 
-                  edgecolors='black', linewidths=2)
+                  edgecolors='black', linewidths=2, animated=True)
+        self.status_text = self.ax.text2D(0.05, 0.95, '', transform=self.ax.transAxes, 
+                                          fontsize=12, verticalalignment='top', animated=True,
+                                          bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.8))
+        self.action_text = self.ax.text2D(0.05, 0.88, '', transform=self.ax.transAxes, 
+                                          fontsize=11, verticalalignment='top', animated=True,
+                                          bbox=dict(boxstyle='round', facecolor='lightblue', alpha=0.8))
         
-        # Add status text
+        self.ax.set_xlabel('Position', fontsize=12)
+        self.ax.set_ylabel('Velocity', fontsize=12)
+        self.ax.set_zlabel('Height', fontsize=12)
+        self.ax.set_title('3D Mountain Car - Use Arrow Keys to Control!', fontsize=14, fontweight='bold')
+        self.ax.set_xlim([POSITION_MIN - 0.1, POSITION_MAX + 0.1])
+        self.ax.set_ylim([VELOCITY_MIN - 0.01, VELOCITY_MAX + 0.01])
+        self.ax.set_zlim([-1.5, 1.5])
+        self.ax.legend(loc='upper right')
+        self.ax.view_init(elev=30, azim=45)
+        
+    def trail(self):
+        """Positions and velocities of the last TRAIL_LENGTH states, as views into the state arrays"""
+        start = max(0, self.steps + 1 - TRAIL_LENGTH)
+        return self.positions[start:self.steps + 1], self.velocities[start:self.steps + 1]
+        
+    def status_lines(self):
+        """Status and action text describing the game state"""
         status = (f"Position: {self.position:.3f} | Velocity: {self.velocity:.3f} | "
                  f"Steps: {self.steps}/{self.max_steps}")
         if self.game_over:
@@ -106,25 +130,27 @@ class MountainCar3DInteractive:
             action_text += "Neutral (No Key)"
         else:
             action_text += "Forward (Right Arrow)"
+        return status, action_text
         
-        self.ax.text2D(0.05, 0.95, status, transform=self.ax.transAxes, 
-                       fontsize=12, verticalalignment='top',
-                       bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.8))
-        self.ax.text2D(0.05, 0.88, action_text, transform=self.ax.transAxes, 
-                       fontsize=11, verticalalignment='top',
-                       bbox=dict(boxstyle='round', facecolor='lightblue', alpha=0.8))
+    def draw_environment_3d(self):
+        """Update the trajectory, car position and status text to the game state"""
+        # Draw the trail of recent states
+        positions, velocities = self.trail()
+        self.traj_line.set_data_3d(positions, velocities, np.sin(3 * positions))
         
-        self.ax.set_xlabel('Position', fontsize=12)
-        self.ax.set_ylabel('Velocity', fontsize=12)
-        self.ax.set_zlabel('Height', fontsize=12)
-        self.ax.set_title('3D Mountain Car - Use Arrow Keys to Control!', fontsize=14, fontweight='bold')
-        self.ax.set_xlim([POSITION_MIN - 0.1, POSITION_MAX + 0.1])
-        self.ax.set_ylim([VELOCITY_MIN - 0.01, VELOCITY_MAX + 0.01])
-        self.ax.set_zlim([-1.5, 1.5])
-        self.ax.legend(loc='upper right')
-        self.ax.view_init(elev=30, azim=45)
+        # Mark current car position
+        self.car_marker.set_offsets([[self.position, self.velocity]])
+        self.car_marker.set_3d_properties([np.sin(3 * self.position)], 'z')
         
-        plt.tight_layout()
+        # Add status text
+        status, action_text = self.status_lines()
+        self.status_text.set_text(status)
+        self.action_text.set_text(action_text)
+    
+    def update_board(self):
+        """Update the trajectory, car and status, blitting them over the cached scene"""
+        self.draw_environment_3d()
+        self.blitter.update()
     
     def on_key_press(self, event):
         """Handle keyboard input"""
@@ -143,28 +169,40 @@ class MountainCar3DInteractive:
         if event.key in ['left', 'right']:
             self.current_action = ACTIONS[1]  # Neutral
     
-    def update(self, frame):
-        """Update function for animation"""
-        if not self.game_over and not self.auto_mode:
-            # Take action based on current key state
-            reward = self.take_action(self.current_action)
-        elif self.auto_mode and not self.game_over:
-            # Random action for auto mode
-            action = np.random.choice(ACTIONS)
-            self.take_action(action)
+    def advance(self):
+        """Take the steps due since the last frame"""
+        now = time.perf_counter()
+        self.step_clock += now - self.last_frame_time
+        self.last_frame_time = now
+        n_steps = min(int(self.step_clock / STEP_INTERVAL), MAX_STEPS_PER_FRAME)
+        # Time beyond the catch-up limit is dropped rather than replayed over later frames
+        self.step_clock = min(self.step_clock - n_steps * STEP_INTERVAL, STEP_INTERVAL)
         
-        self.draw_environment_3d()
-        return []
+        for _ in range(n_steps):
+            if self.game_over:
+                break
+            if self.auto_mode:
+                # Random action for auto mode
+                self.take_action(np.random.choice(ACTIONS))
+            else:
+                # Take action based on current key state
+                self.take_action(self.current_action)
+    
+    def update(self):
+        """Advance the game and draw once, called by the animation timer"""
+        self.advance()
+        self.update_board()
+    
+    def record_state(self):
+        """Store the current state at index self.steps of the state arrays"""
+        self.positions[self.steps] = self.position
+        self.velocities[self.steps] = self.velocity
     
     def take_action(self, action):
         """Take an action and update the game state"""
         self.position, self.velocity, reward = step(self.position, self.velocity, action)
         self.steps += 1
-        self.trajectory.append((self.position, self.velocity))
-        
-        # Keep trajectory to last 100 points for performance
-        if len(self.trajectory) > 100:
-            self.trajectory = self.trajectory[-100:]
+        self.record_state()
         
         # Check if game is over
         if self.position >= POSITION_MAX:
@@ -176,16 +214,19 @@ class MountainCar3DInteractive:
         
         return reward
     
-    def reset_game(self, event=None):
-        """Reset the game"""
+    def reset_state(self):
+        """Start a new episode"""
         self.position = np.random.uniform(-0.6, -0.4)
         self.velocity = 0.0
         self.steps = 0
-        self.trajectory = [(self.position, self.velocity)]
+        self.record_state()
         self.game_over = False
         self.current_action = ACTIONS[1]
-        self.draw_environment_3d()
-        plt.draw()
+    
+    def reset_game(self, event=None):
+        """Reset the game"""
+        self.reset_state()
+        self.update_board()
         print("Game reset!")
     
     def toggle_auto(self, event=None):
@@ -198,6 +239,14 @@ class MountainCar3DInteractive:
     
     def run(self):
         """Run the game"""
+        # Set FAST_3D=1 to play in a PyVista (VTK/OpenGL) window if it is installed
+        if env_flag('FAST_3D'):
+            try:
+                self.run_pyvista()
+                return
+            except ImportError:
+                print("PyVista is not installed, falling back to matplotlib.")
+        
         self.draw_environment_3d()
         print("\nControls:")
         print("  Left Arrow: Reverse (push left)")
@@ -207,9 +256,77 @@ class MountainCar3DInteractive:
         print("  Auto Play button: Enable auto-play")
         print("\nGoal: Reach the top of the mountain (position >= 0.5)")
         
-        # Start animation
-        self.animation = FuncAnimation(self.fig, self.update, interval=50, blit=False)
+        # Start animation, each tick blits only the moving artists
+        self.last_frame_time = time.perf_counter()
+        self.timer = self.fig.canvas.new_timer(interval=FRAME_INTERVAL)
+        self.timer.add_callback(self.update)
+        self.timer.start()
         plt.show()
+    
+    def run_pyvista(self):
+        """Run the game in a GPU-accelerated PyVista window instead of the matplotlib figure"""
+        import pyvista as pv
+        plt.close(self.fig)
+        
+        plotter = pv.Plotter(window_size=(1600, 1200), title='3D Mountain Car')
+        surface = pv.StructuredGrid(SURFACE_X, SURFACE_Y, SURFACE_Z)
+        plotter.add_mesh(surface, scalars=surface.points[:, 2], cmap='terrain', opacity=0.6,
+                         show_scalar_bar=False)
+        plotter.add_mesh(pv.PolyData(np.array([[POSITION_MAX, 0.0, GOAL_HEIGHT]])), color='green',
+                         point_size=25, render_points_as_spheres=True)
+        
+        # The trail and car keep their point counts, each frame only overwrites their coordinates
+        trail = pv.lines_from_points(np.zeros((TRAIL_LENGTH, 3)))
+        car = pv.PolyData(np.zeros((1, 3)))
+        plotter.add_mesh(trail, color='blue', line_width=3)
+        plotter.add_mesh(car, color='red', point_size=30, render_points_as_spheres=True)
+        
+        # The state space is far narrower in velocity than in position, stretch it to a square
+        # but keep labelling the axes in state units
+        plotter.set_scale(yscale=(POSITION_MAX - POSITION_MIN) / (VELOCITY_MAX - VELOCITY_MIN))
+        plotter.show_grid(xtitle='Position', ytitle='Velocity', ztitle='Height', fmt='%.2f',
+                          axes_ranges=[POSITION_MIN, POSITION_MAX, VELOCITY_MIN, VELOCITY_MAX,
+                                       SURFACE_Z.min(), SURFACE_Z.max()])
+        plotter.view_vector((1, 1, 0.8), viewup=(0, 0, 1))
+        
+        def refresh():
+            positions, velocities = self.trail()
+            points = np.column_stack([positions, velocities, np.sin(3 * positions)])
+            # Until the trail is full its oldest slots repeat the first state
+            trail.points = np.pad(points, ((TRAIL_LENGTH - len(points), 0), (0, 0)), mode='edge')
+            car.points = points[-1:]
+            plotter.add_text('\n'.join(self.status_lines()), position='upper_left', font_size=12,
+                             name='status')
+        
+        def tick(step):
+            self.advance()
+            refresh()
+            plotter.render()
+        
+        def reset():
+            self.reset_state()
+            print("Game reset!")
+        
+        # VTK only reports key presses, so Down coasts instead of releasing the arrow,
+        # and R and A are taken by the camera controls
+        for key, action in (('Left', ACTIONS[0]), ('Down', ACTIONS[1]), ('Right', ACTIONS[2])):
+            plotter.add_key_event(key, partial(setattr, self, 'current_action', action))
+        plotter.add_key_event('n', reset)
+        plotter.add_key_event('g', self.toggle_auto)
+        
+        print("\nControls:")
+        print("  Left Arrow: Reverse (push left)")
+        print("  Right Arrow: Forward (push right)")
+        print("  Down Arrow: Neutral (coast)")
+        print("  N: New game")
+        print("  G: Toggle auto-play")
+        print("\nGoal: Reach the top of the mountain (position >= 0.5)")
+        
+        refresh()
+        self.last_frame_time = time.perf_counter()
+        # The timer stops after max_steps ticks, which at FRAME_INTERVAL is several hours of play
+        plotter.add_timer_event(max_steps=10 ** 6, duration=FRAME_INTERVAL, callback=tick)
+        plotter.show()
 
 
 def main():
@@ -3,9 +3,15 @@
 Shows weight divergence in off-policy learning
 """
 import numpy as np
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from plot_utils import FIGURE_DPI
+
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
-import os
 
 # Setup image directory path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -14,6 +20,9 @@ IMAGE_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'images')
 class Counterexample3D:
     def visualize_weight_divergence_3d(self):
         """Visualize weight divergence over time in 3D"""
+        # scipy.signal is slow to import, so it is only loaded once a simulation runs
+        from scipy.signal import lfilter
+        
         fig = plt.figure(figsize=(16, 12))
         ax = fig.add_subplot(111, projection='3d')
         
@@ -21,14 +30,13 @@ class Counterexample3D:
         n_steps = 1000
         n_weights = 8
         
-        weights_history = np.zeros((n_steps, n_weights))
         weights = np.ones(n_weights)
         weights[6] = 10  # Initial condition
         
-        for step in range(n_steps):
-            weights_history[step] = weights
-            # Simplified divergence model
-            weights = weights * 1.01 + np.random.randn(n_weights) * 0.1
+        # Simplified divergence model, weights = weights * 1.01 + noise each step,
+        # run as a recursive filter fed the initial weights and then the noise
+        noise = np.random.randn(n_steps, n_weights) * 0.1
+        weights_history = lfilter([1.0], [1.0, -1.01], np.vstack([weights, noise[:-1]]), axis=0)
         
         # Plot weight trajectories
         for w_idx in range(n_weights):
@@ -47,11 +55,13 @@ class Counterexample3D:
         ax.view_init(elev=30, azim=45)
         
         plt.savefig(os.path.join(IMAGE_DIR, 'counterexample_3d_divergence.png'), 
-                   dpi=150, bbox_inches='tight')
+                   dpi=FIGURE_DPI, bbox_inches='tight')
         plt.show()
         
     def visualize_tdc_convergence_3d(self):
         """Visualize TDC algorithm convergence vs divergence"""
+        from scipy.signal import lfilter
+        
         fig = plt.figure(figsize=(16, 12))
         
         ax1 = fig.add_subplot(1, 2, 1, projection='3d')
@@ -63,21 +73,14 @@ class Counterexample3D:
         # Semi-gradient TD (diverges)
         weights_div = np.ones(n_weights)
         weights_div[6] = 10
-        history_div = np.zeros((n_steps, n_weights))
-        
-        for step in range(n_steps):
-            history_div[step] = weights_div
-            weights_div = weights_div * 1.02 + np.random.randn(n_weights) * 0.05
+        noise = np.random.randn(n_steps, n_weights) * 0.05
+        history_div = lfilter([1.0], [1.0, -1.02], np.vstack([weights_div, noise[:-1]]), axis=0)
         
         # TDC (converges)
         weights_conv = np.ones(n_weights)
         weights_conv[6] = 10
-        history_conv = np.zeros((n_steps, n_weights))
-        target = np.zeros(n_weights)
-        
-        for step in range(n_steps):
-            history_conv[step] = weights_conv
-            weights_conv = weights_conv * 0.99 + (target - weights_conv) * 0.01
+        # Decaying towards a zero target, weights * 0.99 + (0 - weights) * 0.01 = weights * 0.98
+        history_conv = 0.98 ** np.arange(n_steps)[:, None] * weights_conv
         
         # Plot divergence
         for w_idx in range(n_weights):
@@ -103,7 +106,7 @@ class Counterexample3D:
         
         plt.tight_layout()
         plt.savefig(os.path.join(IMAGE_DIR, 'counterexample_3d_comparison.png'), 
-                   dpi=150, bbox_inches='tight')
+                   dpi=FIGURE_DPI, bbox_inches='tight')
         plt.show()
 
 
@@ -3,9 +3,15 @@
 Shows eligibility traces and lambda-return surfaces
 """
 import numpy as np
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from plot_utils import FIGURE_DPI, surface_edges
+
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
-import os
 
 # Setup image directory path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -14,6 +20,9 @@ IMAGE_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'images')
 class TDLambda3D:
     def visualize_eligibility_traces_3d(self):
         """Visualize eligibility traces over time in 3D"""
+        # Imported here, not at the top, so only a run that draws the traces pays for loading scipy.signal
+        from scipy.signal import lfilter
+        
         fig = plt.figure(figsize=(16, 12))
         ax = fig.add_subplot(111, projection='3d')
         
@@ -22,29 +31,27 @@ class TDLambda3D:
         lambda_val = 0.9
         gamma = 1.0
         
-        # Simulate eligibility traces
-        traces = np.zeros((n_steps, n_states))
-        
-        # Agent visits states over time
+        # Agent visits states over time, a random nearby state each step, with the moves drawn in one batch.
+        # A move off either end leaves the agent in place, which a clipped cumsum would not reproduce,
+        # so the walk is accumulated over plain Python ints
         visited_states = [9]  # Start in middle
-        for step in range(n_steps):
-            # Decay all traces
-            if step > 0:
-                traces[step] = traces[step-1] * gamma * lambda_val
-            
-            # Visit a random nearby state
-            if step < n_steps - 1:
-                current = visited_states[-1]
-                next_state = max(0, min(n_states-1, current + np.random.choice([-1, 1])))
-                visited_states.append(next_state)
-                traces[step][next_state] += 1  # Increment trace for visited state
+        for move in np.random.choice([-1, 1], size=n_steps - 1).tolist():
+            visited_states.append(max(0, min(n_states-1, visited_states[-1] + move)))
+        
+        # Step t increments the trace of the state it visits, the last step visits none
+        visits = np.zeros((n_steps, n_states))
+        visits[np.arange(n_steps - 1), visited_states[1:]] = 1
+        
+        # Simulate eligibility traces, traces[t] = gamma * lambda * traces[t-1] + visits[t]
+        # is a first-order recursive filter, so run it down the time axis in one call
+        traces = lfilter([1.0], [1.0, -gamma * lambda_val], visits, axis=0)
         
         # Plot 3D surface
         X, Y = np.meshgrid(range(n_states), range(n_steps))
         Z = traces
         
-        surf = ax.plot_surface(X, Y, Z, cmap='plasma', alpha=0.8,
-                               linewidth=0.5, antialiased=True)
+        surf = ax.plot_surface(X, Y, Z, cmap='plasma', alpha=0.8, rstride=1, cstride=1,
+                               antialiased=True, rasterized=True, **surface_edges(max(Z.shape)))
         
         ax.set_xlabel('State', fontsize=12)
         ax.set_ylabel('Time Step', fontsize=12)
@@ -54,7 +61,7 @@ class TDLambda3D:
         
         plt.colorbar(surf, ax=ax, shrink=0.5, aspect=20)
         plt.savefig(os.path.join(IMAGE_DIR, 'td_lambda_3d_traces.png'), 
-                   dpi=150, bbox_inches='tight')
+                   dpi=FIGURE_DPI, bbox_inches='tight')
         plt.show()
         
     def visualize_lambda_effect_3d(self):
@@ -67,17 +74,12 @@ class TDLambda3D:
         
         # Create performance surface (simplified model)
         X, Y = np.meshgrid(alpha_values, lambda_values)
-        Z = np.zeros_like(X)
-        
-        for i, lam in enumerate(lambda_values):
-            for j, alpha in enumerate(alpha_values):
-                # Simplified error model: optimal around α=0.5, λ=0.9
-                error = abs(alpha - 0.5) + abs(lam - 0.9) * 0.5
-                Z[i, j] = error
+        # Simplified error model: optimal around α=0.5, λ=0.9
+        Z = np.abs(X - 0.5) + np.abs(Y - 0.9) * 0.5
         
         # Plot surface
-        surf = ax.plot_surface(X, Y, Z, cmap='viridis', alpha=0.9,
-                               linewidth=0.5, antialiased=True)
+        surf = ax.plot_surface(X, Y, Z, cmap='viridis', alpha=0.9, rstride=1, cstride=1,
+                               antialiased=True, rasterized=True, **surface_edges(max(Z.shape)))
         
         # Mark optimal point
         ax.scatter([0.5], [0.9], [Z.min()], c='red', s=200, marker='*',
@@ -92,7 +94,7 @@ class TDLambda3D:
         
         plt.colorbar(surf, ax=ax, shrink=0.5, aspect=20)
         plt.savefig(os.path.join(IMAGE_DIR, 'td_lambda_3d_parameter_space.png'), 
-                   dpi=150, bbox_inches='tight')
+                   dpi=FIGURE_DPI, bbox_inches='tight')
         plt.show()
 
 
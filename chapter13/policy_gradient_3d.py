@@ -3,53 +3,105 @@
 Shows policy parameter space and gradient ascent
 """
 import numpy as np
+import functools
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from plot_utils import FIGURE_DPI, reuse_figure, shared_figure, show_or_close, surface_edges
+
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
-import os
+from matplotlib.animation import FuncAnimation
+from matplotlib.transforms import Bbox
 
 # Setup image directory path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGE_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'images')
 
+# Size of every figure in this module, in inches
+FIGSIZE = (16, 12)
+# Part of a FIGSIZE figure that holds the axes, labels, legend and colorbar, in inches, measured
+# with fig.get_tightbbox() on both saved figures and padded a little, saving it directly skips
+# the extra layout pass bbox_inches='tight' makes to measure it, re-measure it if FIGSIZE changes
+SAVE_BBOX = Bbox.from_extents(2.3, 1.2, 13.4, 10.9)
+
+
+def _save_figure(fig, filename):
+    """Save fig to the image directory, cropped to SAVE_BBOX"""
+    assert tuple(fig.get_size_inches()) == FIGSIZE, 'SAVE_BBOX only fits FIGSIZE figures'
+    fig.savefig(os.path.join(IMAGE_DIR, filename), dpi=FIGURE_DPI, bbox_inches=SAVE_BBOX)
+
+
+@functools.lru_cache(maxsize=4)
+def _compute_policy_surface(n=30):
+    """Expected return over an n x n grid of policy parameters, as (X, Y, Z)
+    The arrays are cached and shared between calls, so do not modify them
+    """
+    # Policy parameters θ (simplified 2D parameter space)
+    theta1 = np.linspace(-2, 2, n, dtype=np.float32)
+    theta2 = np.linspace(-2, 2, n, dtype=np.float32)
+    # Sparse row and column grids, the surface below broadcasts them to n x n
+    X, Y = np.meshgrid(theta1, theta2, sparse=True)
+    
+    # Expected return surface (simplified)
+    # True value function for short corridor: v(s) = (2p - 4) / (p(1-p))
+    # where p = probability of going right
+    # Softmax over the two preferences, in closed form for two actions
+    p_right = 1.0 / (1.0 + np.exp(X - Y))
+    
+    # Value function (avoiding division by zero)
+    valid = (p_right > 0.01) & (p_right < 0.99)
+    Z = np.where(valid, (2 * p_right - 4) / (p_right * (1 - p_right)), -100.0)
+    
+    # Clip extreme values for visualization
+    np.clip(Z, -50, 10, out=Z)
+    # plot_surface needs full grids, broadcast views give them without copying
+    X, Y = np.broadcast_arrays(X, Y)
+    return X, Y, Z
+
+
+def _performance_surface():
+    """Simple concave performance surface over a 40 x 40 parameter grid, as sparse X and Y and full Z"""
+    theta1 = np.linspace(-2, 2, 40, dtype=np.float32)
+    theta2 = np.linspace(-2, 2, 40, dtype=np.float32)
+    X, Y = np.meshgrid(theta1, theta2, sparse=True)
+    Z = -(X**2 + Y**2) + 10  # Simple quadratic (concave), broadcast to the full grid
+    return X, Y, Z
+
+
+def _gradient_ascent_path(n_steps=50, alpha=0.1):
+    """Parameters and performance along n_steps of gradient ascent on the performance surface"""
+    theta = np.array([-1.5, -1.5])
+    
+    # The gradient (simplified) is -2 * theta, so each step scales theta by 1 - 2 * alpha
+    # and the steps have a closed form
+    steps = np.arange(n_steps + 1)
+    trajectory = theta * ((1 - 2 * alpha) ** steps)[:, None]
+    traj_z = -(trajectory ** 2).sum(axis=1) + 10
+    return trajectory, traj_z
+
+
 class PolicyGradient3D:
-    def visualize_policy_surface_3d(self):
-        """Visualize policy parameter space"""
-        fig = plt.figure(figsize=(16, 12))
+    def visualize_policy_surface_3d(self, fig=None):
+        """Visualize policy parameter space, drawing on fig if given"""
+        owns_fig = fig is None
+        fig = reuse_figure(fig, FIGSIZE)
         ax = fig.add_subplot(111, projection='3d')
         
-        # Policy parameters θ (simplified 2D parameter space)
-        theta1 = np.linspace(-2, 2, 50)
-        theta2 = np.linspace(-2, 2, 50)
-        X, Y = np.meshgrid(theta1, theta2)
-        
-        # Expected return surface (simplified)
-        # True value function for short corridor: v(s) = (2p - 4) / (p(1-p))
-        # where p = probability of going right
-        Z = np.zeros_like(X)
-        for i in range(len(theta1)):
-            for j in range(len(theta2)):
-                # Softmax to get probability
-                h = np.array([theta1[i], theta2[j]])
-                exp_h = np.exp(h - np.max(h))
-                prob = exp_h / np.sum(exp_h)
-                p_right = prob[1]
-                
-                # Value function (avoiding division by zero)
-                if p_right > 0.01 and p_right < 0.99:
-                    Z[i, j] = (2 * p_right - 4) / (p_right * (1 - p_right))
-                else:
-                    Z[i, j] = -100
-        
-        # Clip extreme values for visualization
-        Z = np.clip(Z, -50, 10)
+        # The surface is smooth, a 30 x 30 grid draws it as well as a finer one
+        X, Y, Z = _compute_policy_surface(30)
         
         # Plot surface
-        surf = ax.plot_surface(X, Y, Z, cmap='viridis', alpha=0.9,
-                               linewidth=0.5, antialiased=True)
-        
-        # Mark optimal point
-        optimal_idx = np.unravel_index(np.argmax(Z), Z.shape)
-        ax.scatter([X[optimal_idx]], [Y[optimal_idx]], [Z[optimal_idx]], 
+        surf = ax.plot_surface(X, Y, Z, cmap='viridis', alpha=0.9, rstride=1, cstride=1,
+                               antialiased=True, rasterized=True, **surface_edges(max(Z.shape)))
+        
+        # Mark optimal point, the value peaks at p = 2 - √2, which holds along the whole line
+        # θ₁ - θ₂ = log((1 - p) / p), so mark where that line crosses θ₁ = -θ₂
+        p_star = 2 - np.sqrt(2)
+        theta_gap = np.log((1 - p_star) / p_star)
+        ax.scatter([theta_gap / 2], [-theta_gap / 2], [(2 * p_star - 4) / (p_star * (1 - p_star))], 
                   c='red', s=300, marker='*', label='Optimal Policy', zorder=10)
         
         ax.set_xlabel('θ₁ (Parameter 1)', fontsize=12)
@@ -59,45 +111,33 @@ class PolicyGradient3D:
         ax.legend()
         ax.view_init(elev=30, azim=45)
         
-        plt.colorbar(surf, ax=ax, shrink=0.5, aspect=20)
-        plt.savefig(os.path.join(IMAGE_DIR, 'policy_gradient_3d_surface.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+        fig.colorbar(surf, ax=ax, shrink=0.5, aspect=20)
+        _save_figure(fig, 'policy_gradient_3d_surface.png')
+        if owns_fig:
+            show_or_close(fig)
         
-    def visualize_gradient_ascent_3d(self):
-        """Visualize gradient ascent trajectory in 3D"""
-        fig = plt.figure(figsize=(16, 12))
+    def visualize_gradient_ascent_3d(self, fig=None):
+        """Visualize gradient ascent trajectory in 3D, drawing on fig if given"""
+        owns_fig = fig is None
+        fig = reuse_figure(fig, FIGSIZE)
         ax = fig.add_subplot(111, projection='3d')
         
         # Create performance surface
-        theta1 = np.linspace(-2, 2, 40)
-        theta2 = np.linspace(-2, 2, 40)
-        X, Y = np.meshgrid(theta1, theta2)
-        Z = -(X**2 + Y**2) + 10  # Simple quadratic (concave)
+        X, Y, Z = _performance_surface()
         
         # Plot surface
-        surf = ax.plot_surface(X, Y, Z, cmap='viridis', alpha=0.6,
-                               linewidth=0.5, antialiased=True)
+        surf = ax.plot_surface(X, Y, Z, cmap='viridis', alpha=0.6, rstride=1, cstride=1,
+                               antialiased=True, rasterized=True, **surface_edges(max(Z.shape)))
         
         # Simulate gradient ascent trajectory
-        theta = np.array([-1.5, -1.5])
-        alpha = 0.1
-        trajectory = [theta.copy()]
-        
-        for step in range(50):
-            # Gradient (simplified)
-            grad = -2 * theta
-            theta = theta + alpha * grad
-            trajectory.append(theta.copy())
-        
-        trajectory = np.array(trajectory)
+        trajectory, traj_z = _gradient_ascent_path()
         
         # Plot trajectory
-        traj_z = -(trajectory[:, 0]**2 + trajectory[:, 1]**2) + 10
         ax.plot(trajectory[:, 0], trajectory[:, 1], traj_z, 
                'r-', linewidth=3, label='Gradient Ascent Path', zorder=10)
+        # Color the steps from the start of cool to its end, looked up once instead of on every draw
         ax.scatter(trajectory[:, 0], trajectory[:, 1], traj_z,
-                  c=range(len(trajectory)), cmap='cool', s=100, zorder=11)
+                  c=plt.cm.cool(np.linspace(0, 1, len(trajectory))), s=100, zorder=11)
         
         # Mark start and end
         ax.scatter([trajectory[0, 0]], [trajectory[0, 1]], [traj_z[0]],
@@ -112,18 +152,54 @@ class PolicyGradient3D:
         ax.legend()
         ax.view_init(elev=30, azim=45)
         
-        plt.colorbar(surf, ax=ax, shrink=0.5, aspect=20)
-        plt.savefig(os.path.join(IMAGE_DIR, 'policy_gradient_3d_ascent.png'), 
-                   dpi=150, bbox_inches='tight')
-        plt.show()
+        fig.colorbar(surf, ax=ax, shrink=0.5, aspect=20)
+        _save_figure(fig, 'policy_gradient_3d_ascent.png')
+        if owns_fig:
+            show_or_close(fig)
+    
+    def animate_gradient_ascent(self, n_frames=50):
+        """Animate gradient ascent one step per frame, returns the animation, which must be kept alive"""
+        fig = plt.figure(figsize=FIGSIZE)
+        ax = fig.add_subplot(111, projection='3d')
+        
+        # The surface never changes, so it is drawn once and only the path is redrawn each frame
+        X, Y, Z = _performance_surface()
+        ax.plot_surface(X, Y, Z, cmap='viridis', alpha=0.6, rstride=1, cstride=1,
+                        antialiased=True, rasterized=True, **surface_edges(max(Z.shape)))
+        trajectory, traj_z = _gradient_ascent_path(n_frames - 1)
+        path, = ax.plot([], [], [], 'r-', linewidth=3, label='Gradient Ascent Path', zorder=10)
+        head, = ax.plot([], [], [], 'r*', markersize=20, label='Current θ', zorder=12)
+        
+        ax.set_xlabel('θ₁', fontsize=12)
+        ax.set_ylabel('θ₂', fontsize=12)
+        ax.set_zlabel('Expected Return', fontsize=12)
+        ax.set_title('3D REINFORCE: Gradient Ascent Trajectory', fontsize=14, fontweight='bold')
+        ax.legend()
+        ax.view_init(elev=30, azim=45)
+        
+        def update(frame):
+            # Move the existing path and marker, the surface collection is left untouched
+            path.set_data_3d(trajectory[:frame + 1, 0], trajectory[:frame + 1, 1], traj_z[:frame + 1])
+            head.set_data_3d(trajectory[frame:frame + 1, 0], trajectory[frame:frame + 1, 1], traj_z[frame:frame + 1])
+            return path, head
+        
+        anim = FuncAnimation(fig, update, frames=n_frames, interval=100, blit=True, repeat=False)
+        show_or_close(fig)
+        return anim
 
 
 def main():
     pg3d = PolicyGradient3D()
+    # Nothing is shown when headless, so draw both figures on one reused canvas
+    fig = shared_figure()
+    
     print("Visualizing policy parameter space...")
-    pg3d.visualize_policy_surface_3d()
+    pg3d.visualize_policy_surface_3d(fig=fig)
     print("\nVisualizing gradient ascent...")
-    pg3d.visualize_gradient_ascent_3d()
+    pg3d.visualize_gradient_ascent_3d(fig=fig)
+    
+    if fig is not None:
+        plt.close(fig)
     print("Complete!")
 
 
@@ -2,9 +2,14 @@
 Master script to play interactive 3D games
 Provides a menu to select which game to play
 """
+import importlib
+import logging
 import os
 import sys
 
+# Errors are reported through one logger, configured once by main()
+log = logging.getLogger(__name__)
+
 def print_menu():
     """Print the menu of available games"""
     print("\n" + "="*60)
@@ -22,52 +27,58 @@ def run_tic_tac_toe():
     """Run Tic-Tac-Toe game"""
     print("\nStarting Tic-Tac-Toe 3D Game...")
     try:
-        from chapter01.tic_tac_toe_3d_game import TicTacToe3DGame
-        game = TicTacToe3DGame(player_vs_ai=True)
+        game = importlib.import_module('chapter01.tic_tac_toe_3d_game').TicTacToe3DGame(player_vs_ai=True)
         game.run()
-    except Exception as e:
-        print(f"Error running Tic-Tac-Toe: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error running Tic-Tac-Toe")
 
 def run_cliff_walking():
     """Run Cliff Walking game"""
     print("\nStarting Cliff Walking 3D Game...")
     try:
-        from chapter06.cliff_walking_3d_game import CliffWalking3DGame
-        game = CliffWalking3DGame()
+        game = importlib.import_module('chapter06.cliff_walking_3d_game').CliffWalking3DGame()
         game.run()
-    except Exception as e:
-        print(f"Error running Cliff Walking: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error running Cliff Walking")
 
 def run_mountain_car():
     """Run Mountain Car game"""
     print("\nStarting Mountain Car 3D Game...")
     try:
-        from chapter10.mountain_car_3d_interactive import MountainCar3DInteractive
-        game = MountainCar3DInteractive()
+        game = importlib.import_module('chapter10.mountain_car_3d_interactive').MountainCar3DInteractive()
         game.run()
-    except Exception as e:
-        print(f"Error running Mountain Car: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error running Mountain Car")
 
 def run_maze():
     """Run Maze game"""
     print("\nStarting Maze 3D Game...")
     try:
-        from chapter08.maze_3d_game import Maze3DGame
-        game = Maze3DGame()
+        game = importlib.import_module('chapter08.maze_3d_game').Maze3DGame()
         game.run()
-    except Exception as e:
-        print(f"Error running Maze: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error running Maze")
+
+# Menu choices and the games they start, '0' exits the menu
+DISPATCH = {
+    '1': run_tic_tac_toe,
+    '2': run_cliff_walking,
+    '3': run_mountain_car,
+    '4': run_maze,
+}
 
 def main():
-    """Main menu loop"""
+    """Main menu loop, or play one game with --game <choice>"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    args = sys.argv[1:]
+    if '--game' in args:
+        index = args.index('--game') + 1
+        choice = args[index] if index < len(args) else ''
+        if choice in DISPATCH:
+            DISPATCH[choice]()
+        else:
+            print(f"Unknown game '{choice}'. Please pass a number between 1-4.")
+        return
     while True:
         print_menu()
         try:
@@ -76,24 +87,20 @@ def main():
             if choice == '0':
                 print("\nThanks for playing!")
                 break
-            elif choice == '1':
-                run_tic_tac_toe()
-            elif choice == '2':
-                run_cliff_walking()
-            elif choice == '3':
-                run_mountain_car()
-            elif choice == '4':
-                run_maze()
+            elif choice in DISPATCH:
+                DISPATCH[choice]()
             else:
                 print("\nInvalid choice. Please enter a number between 0-4.")
                 
         except KeyboardInterrupt:
             print("\n\nExiting...")
             break
-        except Exception as e:
-            print(f"\nError: {e}")
-            import traceback
-            traceback.print_exc()
+        except EOFError:
+            # stdin is closed, so no further choice can ever be read
+            print("\n\nNo more input, exiting...")
+            break
+        except Exception:
+            log.exception("Error")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,147 @@
+"""
+Shared plotting helpers for the 3D visualization scripts
+Import this before matplotlib.pyplot, so the backend is chosen first
+"""
+import os
+import sys
+import numpy as np
+import matplotlib
+
+
+def env_flag(name, default=False):
+    """Whether the environment variable name is set to 1, true, yes or on, default when it is unset or empty"""
+    value = os.environ.get(name, '').strip().lower()
+    if not value:
+        return default
+    return value in ('1', 'true', 'yes', 'on')
+
+
+# Set HEADLESS=1 to render straight to PNG with the Agg backend, without opening windows,
+# when it is unset Linux sessions without a display are headless automatically
+HEADLESS = env_flag('HEADLESS', sys.platform.startswith('linux') and not os.environ.get('DISPLAY')
+                    and not os.environ.get('WAYLAND_DISPLAY'))
+if HEADLESS:
+    matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+from matplotlib.collections import Collection
+
+# Resolution of saved figures, surfaces are rasterized so this sets the output cost
+FIGURE_DPI = 100
+
+
+def surface_edges(n):
+    """plot_surface cell outline style, edges are only drawn on grids small enough to read them"""
+    if n <= 10:
+        return {'edgecolor': 'black', 'linewidth': 0.5}
+    return {'edgecolor': 'none', 'linewidth': 0}
+
+
+# Faces of the unit cube in the order and winding bar3d uses, so shading matches
+CUBE_FACES = np.array([
+    ((0, 0, 0), (0, 1, 0), (1, 1, 0), (1, 0, 0)),  # -z
+    ((0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1)),  # +z
+    ((0, 0, 0), (1, 0, 0), (1, 0, 1), (0, 0, 1)),  # -y
+    ((0, 1, 0), (0, 1, 1), (1, 1, 1), (1, 1, 0)),  # +y
+    ((0, 0, 0), (0, 0, 1), (0, 1, 1), (0, 1, 0)),  # -x
+    ((1, 0, 0), (1, 1, 0), (1, 1, 1), (1, 0, 1)),  # +x
+], dtype=float)
+
+
+def bar_faces(x, y, z, dx, dy, dz):
+    """Faces of bars anchored at (x, y, z) with size (dx, dy, dz), as one (N*6, 4, 3) array"""
+    corners = np.column_stack(np.broadcast_arrays(x, y, z)).astype(float)
+    return (corners[:, None, None, :] + CUBE_FACES * [dx, dy, dz]).reshape(-1, 4, 3)
+
+
+# Floor cell colors, RdYlGn at 1.0 for open cells and at 0.3 for blocked ones,
+# index it with a blocked mask instead of colormapping every cell
+FLOOR_LUT = plt.cm.RdYlGn([1.0, 0.3])
+
+# Corners of one floor cell in the order plot_surface walks them
+FLOOR_CELL = np.array([(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0)], dtype=float)
+
+
+def floor_faces(height, width):
+    """Cells of the z=0 plot_surface over a height x width grid, as one ((height-1)*(width-1), 4, 3) array"""
+    rows, cols = np.mgrid[:height - 1, :width - 1]
+    corners = np.column_stack([cols.ravel(), rows.ravel(), np.zeros(rows.size)])
+    return corners[:, None, :] + FLOOR_CELL
+
+
+def reuse_figure(fig, figsize):
+    """A new figure, or fig cleared and resized so one figure can be reused"""
+    if fig is None:
+        return plt.figure(figsize=figsize)
+    fig.clf()
+    fig.set_size_inches(figsize)
+    return fig
+
+
+class BlitManager:
+    """Caches a figure's static scene after every full draw and blits a fixed set of animated artists over it
+    The artists must be created with animated=True, so full draws leave them out of the cached scene
+    """
+    def __init__(self, ax, artists):
+        self.ax = ax
+        self.fig = ax.figure
+        self.artists = list(artists)
+        self.background = None
+        # Lay the figure out once here, blitted frames never redo the layout
+        self.fig.tight_layout()
+        self.fig.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def on_draw(self, event):
+        """Cache the static scene after a full draw, then paint the animated artists on top"""
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_animated()
+
+    def draw_animated(self):
+        """Draw the animated artists"""
+        for artist in self.artists:
+            # 3D collections are only projected during a full draw, so project them here
+            if isinstance(artist, Collection):
+                artist.do_3d_projection()
+            self.ax.draw_artist(artist)
+
+    def update(self):
+        """Show the animated artists' current state, blitting them over the cached scene"""
+        canvas = self.fig.canvas
+        if self.background is None:
+            # Nothing cached yet, fall back to a full (deferred) draw
+            canvas.draw_idle()
+            return
+        canvas.restore_region(self.background)
+        self.draw_animated()
+        canvas.blit(self.fig.bbox)
+
+
+def shared_figure():
+    """One figure for a script to reuse across its plots when headless, None when each plot opens its own window"""
+    return plt.figure() if HEADLESS else None
+
+
+def use_headless():
+    """Switch to headless rendering at runtime, for batch runs started after pyplot was imported,
+    returns the previous backend and HEADLESS value for restore_rendering
+    """
+    global HEADLESS
+    previous = (plt.get_backend(), HEADLESS)
+    HEADLESS = True
+    plt.switch_backend('Agg')
+    return previous
+
+
+def restore_rendering(previous):
+    """Undo use_headless, given what it returned"""
+    global HEADLESS
+    backend, HEADLESS = previous
+    plt.switch_backend(backend)
+
+
+def show_or_close(fig):
+    """Show the figure interactively, or just release it when rendering headless"""
+    if HEADLESS:
+        plt.close(fig)
+    else:
+        plt.show()
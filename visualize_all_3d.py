@@ -2,9 +2,14 @@
 Master script to run all 3D visualizations
 Provides a menu to select which chapter's 3D visualization to run
 """
+import importlib
+import logging
 import os
 import sys
 
+# Errors are reported through one logger, configured once by main()
+log = logging.getLogger(__name__)
+
 def print_menu():
     """Print the menu of available 3D visualizations"""
     print("\n" + "="*60)
@@ -22,98 +27,130 @@ def print_menu():
     print("  0. Exit")
     print("\n" + "="*60)
 
+# The run_chapterN functions let errors propagate, Run All reports each failed chapter
+# and the menu loop logs the error before showing the menu again
 def run_chapter1():
     """Run Chapter 1 3D visualization"""
     print("\nRunning Chapter 1: Tic-Tac-Toe 3D...")
-    try:
-        from chapter01.tic_tac_toe_3d import main
-        main()
-    except Exception as e:
-        print(f"Error running Chapter 1: {e}")
+    importlib.import_module('chapter01.tic_tac_toe_3d').main()
 
 def run_chapter2():
     """Run Chapter 2 3D visualization"""
     print("\nRunning Chapter 2: Multi-Armed Bandits 3D...")
-    try:
-        from chapter02.bandits_3d import main
-        main()
-    except Exception as e:
-        print(f"Error running Chapter 2: {e}")
+    importlib.import_module('chapter02.bandits_3d').main()
 
 def run_chapter3():
     """Run Chapter 3 3D visualization"""
     print("\nRunning Chapter 3: Gridworld 3D...")
-    try:
-        from chapter03.gridworld_3d import main
-        main()
-    except Exception as e:
-        print(f"Error running Chapter 3: {e}")
+    importlib.import_module('chapter03.gridworld_3d').main()
 
 def run_chapter5():
     """Run Chapter 5 3D visualization"""
     print("\nRunning Chapter 5: Blackjack 3D...")
-    try:
-        from chapter05.blackjack_3d import main
-        main()
-    except Exception as e:
-        print(f"Error running Chapter 5: {e}")
+    importlib.import_module('chapter05.blackjack_3d').main()
 
 def run_chapter6():
     """Run Chapter 6 3D visualization"""
     print("\nRunning Chapter 6: Cliff Walking 3D...")
-    try:
-        from chapter06.cliff_walking_3d import main
-        main()
-    except Exception as e:
-        print(f"Error running Chapter 6: {e}")
+    importlib.import_module('chapter06.cliff_walking_3d').main()
 
 def run_chapter8():
     """Run Chapter 8 3D visualization"""
     print("\nRunning Chapter 8: Maze 3D...")
-    try:
-        from chapter08.maze_3d import main
-        main()
-    except Exception as e:
-        print(f"Error running Chapter 8: {e}")
+    importlib.import_module('chapter08.maze_3d').main()
 
 def run_chapter10():
     """Run Chapter 10 3D visualization"""
     print("\nRunning Chapter 10: Mountain Car 3D...")
+    importlib.import_module('chapter10.mountain_car_3d_game').main()
+
+# Chapters run by Run All, in menu order
+CHAPTERS = [
+    ("Chapter 1", run_chapter1),
+    ("Chapter 2", run_chapter2),
+    ("Chapter 3", run_chapter3),
+    ("Chapter 5", run_chapter5),
+    ("Chapter 6", run_chapter6),
+    ("Chapter 8", run_chapter8),
+    ("Chapter 10", run_chapter10),
+]
+
+def _run_one(name):
+    """Run one chapter, returns the error message if it failed"""
+    import matplotlib.pyplot as plt
+    
+    print(f"\n{'='*60}")
+    print(f"Running {name}...")
+    print('='*60)
     try:
-        from chapter10.mountain_car_3d_game import main
-        main()
+        dict(CHAPTERS)[name]()
+        return None
     except Exception as e:
-        print(f"Error running Chapter 10: {e}")
+        log.exception("Error running %s", name)
+        return str(e)
+    finally:
+        # Release the chapter's figures before the next one starts
+        plt.close('all')
+
+def _run_one_spawned(name):
+    """Run one chapter in a spawned worker, which renders headless for good"""
+    from plot_utils import use_headless
+    
+    use_headless()
+    # Spawned workers never run main(), so set up their logging here
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    return _run_one(name)
 
 def run_all():
-    """Run all 3D visualizations"""
-    print("\nRunning all 3D visualizations...")
-    chapters = [
-        ("Chapter 1", run_chapter1),
-        ("Chapter 2", run_chapter2),
-        ("Chapter 3", run_chapter3),
-        ("Chapter 5", run_chapter5),
-        ("Chapter 6", run_chapter6),
-        ("Chapter 8", run_chapter8),
-        ("Chapter 10", run_chapter10),
-    ]
+    """Run all 3D visualizations, saving every figure without showing it"""
+    import multiprocessing
+    from plot_utils import use_headless, restore_rendering
     
-    for name, func in chapters:
-        print(f"\n{'='*60}")
-        print(f"Running {name}...")
-        print('='*60)
+    print("\nRunning all 3D visualizations...")
+    names = [name for name, _ in CHAPTERS]
+    processes = min(len(names), os.cpu_count() or 1)
+    if processes > 1:
+        # The chapters share nothing, so run them side by side, spawned workers
+        # start without any GUI backend state from this process
+        with multiprocessing.get_context('spawn').Pool(processes) as pool:
+            errors = pool.map(_run_one_spawned, names)
+    else:
+        # Nobody is watching a batch run, so render straight to PNG instead of blocking on each window,
+        # then go back to the menu's backend so later menu choices open windows again
+        previous = use_headless()
         try:
-            func()
+            errors = [_run_one(name) for name in names]
+        finally:
+            restore_rendering(previous)
+    
+    for name, error in zip(names, errors):
+        if error is None:
             print(f"✓ {name} completed successfully")
-        except Exception as e:
-            print(f"✗ {name} failed: {e}")
+        else:
+            print(f"✗ {name} failed: {error}")
     
     print("\n" + "="*60)
     print("All visualizations completed!")
     print("="*60)
 
+# Menu choices and what they run, '0' exits the menu
+DISPATCH = {
+    '1': run_chapter1,
+    '2': run_chapter2,
+    '3': run_chapter3,
+    '4': run_chapter5,
+    '5': run_chapter6,
+    '6': run_chapter8,
+    '7': run_chapter10,
+    '8': run_all,
+}
+
 def main():
-    """Main menu loop"""
+    """Main menu loop, or run everything once with --batch"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    if '--batch' in sys.argv[1:]:
+        run_all()
+        return
     while True:
         print_menu()
         try:
@@ -122,30 +159,20 @@ def main():
             if choice == '0':
                 print("\nExiting...")
                 break
-            elif choice == '1':
-                run_chapter1()
-            elif choice == '2':
-                run_chapter2()
-            elif choice == '3':
-                run_chapter3()
-            elif choice == '4':
-                run_chapter5()
-            elif choice == '5':
-                run_chapter6()
-            elif choice == '6':
-                run_chapter8()
-            elif choice == '7':
-                run_chapter10()
-            elif choice == '8':
-                run_all()
+            elif choice in DISPATCH:
+                DISPATCH[choice]()
             else:
                 print("\nInvalid choice. Please enter a number between 0-8.")
                 
         except KeyboardInterrupt:
             print("\n\nExiting...")
             break
-        except Exception as e:
-            print(f"\nError: {e}")
+        except EOFError:
+            # stdin is closed, so no further choice can ever be read
+            print("\n\nNo more input, exiting...")
+            break
+        except Exception:
+            log.exception("Error")
 
 if __name__ == '__main__':
     main()